@@ -1,68 +1,783 @@
-import os, time, uuid, json, base64, smtplib, imaplib, email, datetime
-from pathlib import Path
-from email.message import EmailMessage
-
-import requests
-from flask import Flask, send_from_directory, render_template_string
-from dotenv import load_dotenv
-from PIL import Image, ImageDraw
-import threading
-import base64
-import requests
+from __future__ import annotations
+
+import os, re, time, uuid, json, base64, email, datetime, hashlib, unicodedata
+import html, shutil, heapq, itertools, gzip, mmap, io, math, random, textwrap
+import threading, contextvars, contextlib
+from urllib.parse import urlsplit, parse_qsl, urlencode
 from pathlib import Path
-import os
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import html
+from email.header import decode_header, make_header
+from collections import deque, OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+    from imapclient import IMAPClient
+    from PIL import Image
 
+# requests, Flask, waitress, Pillow, imapclient, smtplib, sqlite3 and
+# concurrent.futures are imported where they are used, so a CLI subcommand
+# only pays for the modules it actually needs (see cli()).
 
-load_dotenv()
+if __name__ == "__main__":
+    # Only the CLI reads .env; code importing this module sets its own environment
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # === Paths ===
 BASE_DIR = Path(__file__).parent
 ARCHIVE_DIR = BASE_DIR / "archive"
-ARCHIVE_DIR.mkdir(exist_ok=True)
+CACHE_DIR = BASE_DIR / "cache"
+ARCHIVE_DB_PATH = ARCHIVE_DIR / "archive.db"
+ARCHIVE_PACK_DIR = ARCHIVE_DIR / "packs"
 
 # === LinkedIn config ===
 LINKEDIN_ACCESS_TOKEN = os.getenv("LINKEDIN_ACCESS_TOKEN")
 LINKEDIN_PERSON_URN = os.getenv("LINKEDIN_PERSON_URN")
+LINKEDIN_ACCOUNTS_FILE = Path(os.getenv("LINKEDIN_ACCOUNTS_FILE", str(BASE_DIR / "linkedin_accounts.json")))
+LINKEDIN_MIN_INTERVAL = float(os.getenv("LINKEDIN_MIN_INTERVAL", "0.25"))  # seconds between calls per account
 
 # === Email config ===
 EMAIL_SMTP = os.getenv("EMAIL_SMTP", "smtp.gmail.com")
-EMAIL_SMTP_PORT = int(os.getenv("EMAIL_SMTP_PORT", "587"))
+EMAIL_SMTP_PORT = int(os.getenv("EMAIL_SMTP_PORT", "587"))  # 465 = implicit TLS, else STARTTLS
+EMAIL_SMTP_STARTTLS = os.getenv("EMAIL_SMTP_STARTTLS", "1") == "1"
+EMAIL_SMTP_IDLE_SECONDS = float(os.getenv("EMAIL_SMTP_IDLE_SECONDS", "60"))  # drop an unused connection after this
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "5"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "900"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "12"))
+EMAIL_FLUSH_SECONDS = float(os.getenv("EMAIL_FLUSH_SECONDS", "60"))  # how long exit waits for queued mail
 EMAIL_IMAP = os.getenv("EMAIL_IMAP", "imap.gmail.com")
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_TO = os.getenv("EMAIL_TO", EMAIL_USER)
 EMAIL_PASS = os.getenv("EMAIL_PASS")
+IMAP_IDLE_SECONDS = int(os.getenv("IMAP_IDLE_SECONDS", "300"))
+IMAP_POLL_SECONDS = int(os.getenv("IMAP_POLL_SECONDS", "30"))
 NVIDIA_API_KEY = os.getenv("NVIDIA_API_KEY")
 
 # === Time config ===
 POST_HOUR = int(os.getenv("POST_HOUR", "8"))
 POST_GRACE_MINUTES = int(os.getenv("POST_GRACE_MINUTES", "15"))
 
+# === Archive retention config ===
+ARCHIVE_PACK_AGE_DAYS = int(os.getenv("ARCHIVE_PACK_AGE_DAYS", "90"))
+ARCHIVE_PACK_THUMBNAILS = os.getenv("ARCHIVE_PACK_THUMBNAILS", "0") == "1"  # lossy: keep only a thumbnail of old images
+ARCHIVE_THUMBNAIL_SIZE = int(os.getenv("ARCHIVE_THUMBNAIL_SIZE", "320"))
+
+# === Preview server config ===
+PREVIEW_THREADS = int(os.getenv("PREVIEW_THREADS", "8"))
+PREVIEW_FILE_MAX_AGE = int(os.getenv("PREVIEW_FILE_MAX_AGE", "3600"))
+
+# === Batch config ===
+BATCH_DAYS = int(os.getenv("BATCH_DAYS", "7"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+DRAFT_HOUR = int(os.getenv("DRAFT_HOUR", "6"))  # daemon: when each day's draft is prepared
+
+# === Trending fetch config ===
+HN_FETCH_WORKERS = int(os.getenv("HN_FETCH_WORKERS", "16"))
+HN_FETCH_BUDGET_SECONDS = float(os.getenv("HN_FETCH_BUDGET_SECONDS", "25"))
+HN_ITEM_TTL_SECONDS = int(os.getenv("HN_ITEM_TTL_SECONDS", "300"))  # items carry live score/comment counts
+HTTP_CACHE_MAX_MB = int(os.getenv("HTTP_CACHE_MAX_MB", "50"))
+TOPIC_DUP_THRESHOLD = float(os.getenv("TOPIC_DUP_THRESHOLD", "0.5"))
+TOPIC_CANDIDATES = int(os.getenv("TOPIC_CANDIDATES", "50"))  # HN top-story ids to consider (max 500)
+TOPIC_SOURCES = os.getenv("TOPIC_SOURCES", "hn reddit:technology")  # also feed:<RSS/Atom url>
+TOPIC_SOURCE_BUDGET_SECONDS = float(os.getenv("TOPIC_SOURCE_BUDGET_SECONDS", "10"))  # per source; HN uses HN_FETCH_BUDGET_SECONDS
+TOPIC_SOURCE_GRACE_SECONDS = 1.0  # past its deadline, for a source to hand back what it has
+
+# === Topic ranking config ===
+TOPIC_RANK_WEIGHTS = {"velocity": 1.0, "comments": 0.5, "title": 0.3, "source": 0.5, "novelty": 1.0,
+                      **json.loads(os.getenv("TOPIC_RANK_WEIGHTS", "{}"))}
+TOPIC_SOURCE_WEIGHTS = {"Hacker News": 1.0, "Reddit /r/technology": 0.8,
+                        **json.loads(os.getenv("TOPIC_SOURCE_WEIGHTS", "{}"))}
+TOPIC_NOVELTY_DAYS = int(os.getenv("TOPIC_NOVELTY_DAYS", "30"))  # past posts the novelty penalty looks at
+TOPIC_TITLE_CHARS = 70  # title length that scores best
+
+# === Gemini key pool config ===
+GEMINI_COOLDOWN_SECONDS = int(os.getenv("GEMINI_COOLDOWN_SECONDS", "60"))
+GEMINI_MAX_COOLDOWN_SECONDS = int(os.getenv("GEMINI_MAX_COOLDOWN_SECONDS", "3600"))
+GEMINI_DAILY_QUOTA = int(os.getenv("GEMINI_DAILY_QUOTA", "0"))  # per key, 0 = unlimited
+GEMINI_CACHE_MAX_MB = int(os.getenv("GEMINI_CACHE_MAX_MB", "10"))
+GEMINI_CACHE_BYPASS = os.getenv("GEMINI_CACHE_BYPASS", "0") == "1"
+GEMINI_STREAM = os.getenv("GEMINI_STREAM", "0") == "1"
+GEMINI_STREAM_STALL_SECONDS = float(os.getenv("GEMINI_STREAM_STALL_SECONDS", "10"))
+GEMINI_STREAM_MAX_SECONDS = float(os.getenv("GEMINI_STREAM_MAX_SECONDS", "60"))
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0.9"))  # 0 disables hedging
+GEMINI_HEDGE_DAILY_BUDGET = int(os.getenv("GEMINI_HEDGE_DAILY_BUDGET", "5"))  # max extra calls per day
+GEMINI_HEDGE_MIN_SAMPLES = 10
+
+# === Image cache config ===
+NIM_CACHE_MAX_MB = int(os.getenv("NIM_CACHE_MAX_MB", "200"))
+NIM_CACHE_BYPASS = os.getenv("NIM_CACHE_BYPASS", "0") == "1"
+IMAGE_OPTIMIZE = os.getenv("IMAGE_OPTIMIZE", "1") == "1"
+IMAGE_MIN_PSNR = float(os.getenv("IMAGE_MIN_PSNR", "38"))  # dB, quality floor for lossy encodings
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# === HTTP client config ===
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "10"))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", str(max(4, HN_FETCH_WORKERS))))
+
+# ---------- Metrics + tracing ----------
+
+class Metrics:
+    """
+    Minimal in-process counters and histograms, rendered in the Prometheus
+    text format by the /metrics route.
+    """
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._help = {}
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, help: str = "", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            h = self._histograms.setdefault(key, [0] * len(self.BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()) -> str:
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help or name}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (n, labels), value in sorted(self._counters.items()):
+                        if n == name:
+                            lines.append(f"{name}{self._labels(labels)} {value}")
+                    continue
+                for (n, labels), h in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(self.BUCKETS, h):
+                        lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {h[-1]}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {round(h[-2], 6)}")
+                    lines.append(f"{name}_count{self._labels(labels)} {h[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Trace:
+    """JSON-lines event log for one post, kept at archive/<id>/trace.jsonl."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, event: dict):
+        line = json.dumps({"ts": round(time.time(), 3), **event})
+        with self._lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                print("Could not write trace event:", e)
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+@contextlib.contextmanager
+def tracing(folder_id: str):
+    """Send spans and upstream-call events from this context to the post's trace.jsonl."""
+    token = _current_trace.set(Trace(ARCHIVE_DIR / folder_id / "trace.jsonl"))
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+def trace_event(event: dict):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.emit(event)
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """Time a pipeline stage: tecbee_stage_seconds histogram + a trace event."""
+    started = time.perf_counter()
+    ok = True
+    try:
+        yield attrs
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.observe("tecbee_stage_seconds", seconds, "Pipeline stage duration", stage=name)
+        metrics.inc("tecbee_stage_runs_total", 1, "Pipeline stage runs", stage=name, ok=str(ok).lower())
+        trace_event({"type": "span", "name": name, "seconds": round(seconds, 3), "ok": ok, **attrs})
+
+def submit_in_context(pool: ThreadPoolExecutor, fn, *args):
+    """pool.submit() that carries the caller's trace into the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+# ---------- Shared HTTP client ----------
+
+class HttpClient:
+    """
+    One keep-alive requests.Session shared by every outbound call.
+    Counts connections opened per host so reuse can be checked:
+    reused = requests - opened. The session (and requests itself) is only
+    created on first use.
+    """
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT,
+                 pool_hosts: int = HTTP_POOL_HOSTS, pool_per_host: int = HTTP_POOL_PER_HOST):
+        self.timeout = timeout
+        self.pool_hosts = pool_hosts
+        self.pool_per_host = pool_per_host
+        self._lock = threading.Lock()
+        self._session = None
+        self._opened = {}
+        self._requests = {}
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._make_session()
+        return self._session
+
+    def _make_session(self) -> requests.Session:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+
+        client = self
+
+        class CountingHTTPPool(HTTPConnectionPool):
+            def _new_conn(self):
+                client._count(client._opened, self.host)
+                return super()._new_conn()
+
+        class CountingHTTPSPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                client._count(client._opened, self.host)
+                return super()._new_conn()
+
+        class CountingAdapter(HTTPAdapter):
+            def init_poolmanager(self, *args, **kwargs):
+                super().init_poolmanager(*args, **kwargs)
+                self.poolmanager.pool_classes_by_scheme = {
+                    "http": CountingHTTPPool,
+                    "https": CountingHTTPSPool,
+                }
+
+        session = requests.Session()
+        adapter = CountingAdapter(pool_connections=self.pool_hosts, pool_maxsize=self.pool_per_host)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _count(self, counter: dict, host: str):
+        with self._lock:
+            counter[host] = counter.get(host, 0) + 1
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).hostname or ""
+        self._count(self._requests, host)
+        started = time.perf_counter()
+        status, size, retries = "error", 0, 0
+        try:
+            r = self.session.request(method, url, **kwargs)
+            status = str(r.status_code)
+            # Streamed bodies aren't read yet; fall back to the declared length
+            if kwargs.get("stream"):
+                size = int(r.headers.get("Content-Length") or 0)
+            else:
+                size = len(r.content)
+            retries = len(getattr(getattr(r.raw, "retries", None), "history", ()) or ())
+            return r
+        finally:
+            seconds = time.perf_counter() - started
+            metrics.inc("tecbee_http_requests_total", 1, "Upstream HTTP requests",
+                        host=host, method=method, status=status)
+            metrics.observe("tecbee_http_request_seconds", seconds, "Upstream HTTP latency", host=host)
+            metrics.inc("tecbee_http_response_bytes_total", size, "Upstream response bytes", host=host)
+            trace_event({"type": "http", "host": host, "method": method, "status": status,
+                         "bytes": size, "retries": retries, "seconds": round(seconds, 3)})
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        Connections opened vs reused, in total and per host. Requests are
+        counted by URL host and opens by the host actually dialled; when a
+        proxy or redirect makes those differ, only the totals line up.
+        """
+        with self._lock:
+            hosts = {}
+            for host in sorted(set(self._requests) | set(self._opened)):
+                n, opened = self._requests.get(host, 0), self._opened.get(host, 0)
+                hosts[host] = {"requests": n, "opened": opened, "reused": max(0, n - opened)}
+        requests_, opened = sum(h["requests"] for h in hosts.values()), sum(h["opened"] for h in hosts.values())
+        return {"requests": requests_, "opened": opened, "reused": max(0, requests_ - opened), "hosts": hosts}
+
+
+http_client = HttpClient()
+
+# ---------- On-disk caches ----------
+
+def link_or_copy(src: Path, dst: Path):
+    """Hard-link src to dst (replacing dst), falling back to a copy."""
+    try:
+        dst.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class DiskCache:
+    """
+    Flat directory of files keyed by sha256(key).
+    Reads bump the file mtime, and once the directory grows past
+    max_bytes the least recently used files are deleted.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, suffix: str = ".json"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._size = None
+
+    def path_for(self, key: str) -> Path:
+        return self.root / (hashlib.sha256(key.encode("utf-8")).hexdigest() + self.suffix)
+
+    def get_path(self, key: str) -> Path | None:
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def read_json(self, key: str):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _tmp_path(self, key: str) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(key)
+        return path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+
+    def _install(self, key: str, tmp: Path) -> Path:
+        path = self.path_for(key)
+        size = tmp.stat().st_size
+        with self._lock:
+            self._ensure_size()
+            old = path.stat().st_size if path.exists() else 0
+            os.replace(tmp, path)
+            self._size += size - old
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def write_bytes(self, key: str, data: bytes) -> Path:
+        tmp = self._tmp_path(key)
+        tmp.write_bytes(data)
+        return self._install(key, tmp)
+
+    def put_file(self, key: str, src: Path) -> Path:
+        """Store an existing file, hard-linked when the filesystem allows it."""
+        tmp = self._tmp_path(key)
+        link_or_copy(src, tmp)
+        return self._install(key, tmp)
+
+    def write_json(self, key: str, obj) -> Path:
+        return self.write_bytes(key, json.dumps(obj).encode("utf-8"))
+
+    def _ensure_size(self):
+        if self._size is None:
+            self._size = sum(p.stat().st_size for p in self.root.glob("*" + self.suffix))
+
+    def _evict(self):
+        # Drop oldest files until we're back under 90% of the cap
+        files = sorted(self.root.glob("*" + self.suffix), key=lambda p: p.stat().st_mtime)
+        target = int(self.max_bytes * 0.9)
+        for p in files:
+            if self._size <= target:
+                break
+            try:
+                size = p.stat().st_size
+                p.unlink()
+                self._size -= size
+            except OSError:
+                continue
+
+
+class ResponseCache:
+    """
+    JSON GET responses cached on disk.
+    - ttl=N: serve the stored body without any request for N seconds.
+    - ttl=None: always revalidate with ETag / Last-Modified (304 = reuse).
+    """
+
+    def __init__(self, store: DiskCache):
+        self.store = store
+
+    def get_json(self, url: str, ttl: int | None = None, headers: dict | None = None, **kwargs):
+        entry = self.store.read_json(url)
+        now = time.time()
+        if entry and ttl is not None and now - entry["stored_at"] < ttl:
+            return entry["body"]
+
+        req_headers = dict(headers or {})
+        if entry and entry.get("etag"):
+            req_headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            req_headers["If-Modified-Since"] = entry["last_modified"]
+
+        r = http_client.get(url, headers=req_headers, **kwargs)
+        if entry and r.status_code == 304:
+            entry["stored_at"] = now
+            self.store.write_json(url, entry)
+            return entry["body"]
+        r.raise_for_status()
+        body = r.json()
+        self.store.write_json(url, {
+            "url": url,
+            "stored_at": now,
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "body": body,
+        })
+        return body
+
+
+response_cache = ResponseCache(DiskCache(CACHE_DIR / "http", HTTP_CACHE_MAX_MB * 1024 * 1024))
+
 # ---------- Gemini helpers ----------
 
-def pick_gemini_key() -> str:
-    """Rotate keys by day-of-year."""
+def get_gemini_keys() -> list:
     raw = os.getenv("GEMINI_KEYS", "")
     keys = [k.strip() for k in raw.split(",") if k.strip()]
     if not keys:
         raise RuntimeError("No GEMINI_KEYS set in .env")
-    day_index = datetime.datetime.now().timetuple().tm_yday
-    return keys[day_index % len(keys)]
+    return keys
+
+
+class GeminiKeyPool:
+    """
+    Per-key health for GEMINI_KEYS, persisted in cache/gemini_keys.json.
+
+    Tracks 429s, errors, latency (EWMA) and a per-day request count. A 429
+    puts the key into a cooldown (Retry-After, else GEMINI_COOLDOWN_SECONDS,
+    doubling on repeats up to GEMINI_MAX_COOLDOWN_SECONDS). ordered() returns
+    healthy keys fastest/most reliable first; cooling keys are only tried
+    when nothing else is left. Keys are stored by hash, never in clear.
+    """
+
+    def __init__(self, keys: list, path: Path):
+        self.keys = keys
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {}
+        try:
+            self.state = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key_id(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+    def _entry(self, key: str) -> dict:
+        e = self.state.setdefault(self.key_id(key), {})
+        e.setdefault("latency", 5.0)
+        e.setdefault("fail_rate", 0.0)
+        e.setdefault("rate_limits", 0)
+        e.setdefault("errors", 0)
+        e.setdefault("successes", 0)
+        e.setdefault("cooldown_until", 0.0)
+        e.setdefault("strikes", 0)
+        today = datetime.date.today().isoformat()
+        if e.get("day") != today:
+            e["day"] = today
+            e["day_count"] = 0
+        return e
+
+    def _cooling_until(self, e: dict) -> float:
+        until = e["cooldown_until"]
+        if GEMINI_DAILY_QUOTA and e["day_count"] >= GEMINI_DAILY_QUOTA:
+            tomorrow = datetime.datetime.combine(
+                datetime.date.today() + datetime.timedelta(days=1), datetime.time())
+            until = max(until, tomorrow.timestamp())
+        return until
+
+    def ordered(self) -> list:
+        """Keys to try, best first."""
+        now = time.time()
+        day_index = datetime.datetime.now().timetuple().tm_yday
+        ready, cooling = [], []
+        with self._lock:
+            for i, key in enumerate(self.keys):
+                e = self._entry(key)
+                until = self._cooling_until(e)
+                # Day-of-year rotation only breaks ties between equally healthy keys
+                rotation = (i - day_index) % len(self.keys)
+                if until > now:
+                    cooling.append((until, rotation, key))
+                else:
+                    score = e["latency"] * (1 + 4 * e["fail_rate"])
+                    ready.append((score, rotation, key))
+        return [k for *_, k in sorted(ready)] + [k for *_, k in sorted(cooling)]
+
+    def _record(self, key: str, ok: bool, latency: float | None):
+        e = self._entry(key)
+        e["day_count"] += 1
+        e["fail_rate"] = 0.7 * e["fail_rate"] + 0.3 * (0.0 if ok else 1.0)
+        if latency is not None:
+            e["latency"] = round(0.7 * e["latency"] + 0.3 * latency, 3)
+        return e
+
+    def report_success(self, key: str, latency: float):
+        with self._lock:
+            e = self._record(key, True, latency)
+            e["successes"] += 1
+            e["strikes"] = 0
+            self._save()
+
+    def report_error(self, key: str, latency: float | None = None):
+        with self._lock:
+            e = self._record(key, False, latency)
+            e["errors"] += 1
+            self._save()
+
+    def report_rate_limited(self, key: str, retry_after: str | None = None):
+        with self._lock:
+            e = self._record(key, False, None)
+            e["rate_limits"] += 1
+            e["strikes"] += 1
+            try:
+                wait_s = float(retry_after)
+            except (TypeError, ValueError):
+                wait_s = GEMINI_COOLDOWN_SECONDS * 2 ** (e["strikes"] - 1)
+            e["cooldown_until"] = time.time() + min(wait_s, GEMINI_MAX_COOLDOWN_SECONDS)
+            self._save()
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.state, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print("Could not save Gemini key state:", e)
+
+
+_gemini_pool = None
+
+def get_gemini_key_pool() -> GeminiKeyPool:
+    global _gemini_pool
+    keys = get_gemini_keys()
+    if _gemini_pool is None or _gemini_pool.keys != keys:
+        _gemini_pool = GeminiKeyPool(keys, CACHE_DIR / "gemini_keys.json")
+    return _gemini_pool
+
+def pick_gemini_key() -> str:
+    """Healthiest key right now (day-of-year rotation breaks ties)."""
+    return get_gemini_key_pool().ordered()[0]
+
+class GeminiRateLimited(Exception):
+    def __init__(self, retry_after: str | None = None):
+        super().__init__("rate-limited")
+        self.retry_after = retry_after
+
+
+def _parts_text(data: dict, sep: str = "") -> str:
+    chunks = []
+    for cand in data.get("candidates", []):
+        for part in cand.get("content", {}).get("parts", []):
+            if "text" in part:
+                chunks.append(part["text"])
+    return sep.join(chunks)
+
+def check_post_text(text: str, final: bool = True) -> str | None:
+    """
+    Structural check of a (possibly partial) generated post:
+    greeting first line, bullet lines, hashtags line last.
+    Returns what's wrong, or None if it looks fine so far.
+    """
+    if len(text) > 4000:
+        return "too long"
+    lines = [l.strip() for l in text.strip().splitlines() if l.strip()]
+    if not lines:
+        return "empty" if final else None
+    first_done = final or "\n" in text.lstrip()
+    if first_done and (len(lines[0]) > 160 or lines[0].startswith(("```", "#"))):
+        return "no greeting line"
+    if not final:
+        return None
+    bullets = [l for l in lines[1:-1] if not l[0].isalnum() and not l.startswith("#")]
+    if len(bullets) < 2:
+        return "missing bullets"
+    if not re.search(r"#\w+", lines[-1]):
+        return "missing hashtags line"
+    return None
+
+def request_gemini_text(key: str, model: str, body: dict, cancel: threading.Event | None = None) -> tuple:
+    """
+    Blocking :generateContent call. Returns (text, time to first token).
+    The server only answers once the whole text is generated, so `cancel`
+    can't save that quota; it does stop the body read and close the
+    connection, so a losing hedge is dropped as soon as its answer lands.
+    """
+    if cancel is not None and cancel.is_set():
+        raise RuntimeError("cancelled")
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={key}"
+    started = time.monotonic()
+    with http_client.post(url, json=body, timeout=60, stream=True) as r:
+        if r.status_code == 429:
+            raise GeminiRateLimited(r.headers.get("Retry-After"))
+        r.raise_for_status()
+        chunks = []
+        for chunk in r.iter_content(16384):
+            if cancel is not None and cancel.is_set():
+                raise RuntimeError("cancelled")
+            chunks.append(chunk)
+    text = _parts_text(json.loads(b"".join(chunks)), "\n").strip()
+    return text, time.monotonic() - started
+
+def stream_gemini_text(key: str, model: str, body: dict, cancel: threading.Event | None = None) -> tuple:
+    """
+    :streamGenerateContent over SSE. Parts are accumulated as they arrive
+    and checked with check_post_text(); the call is aborted as soon as the
+    output goes off-format, no bytes arrive for GEMINI_STREAM_STALL_SECONDS,
+    GEMINI_STREAM_MAX_SECONDS pass, or `cancel` is set (a hedged twin won).
+    Returns (text, time to first token).
+    """
+    url = (f"https://generativelanguage.googleapis.com/v1beta/models/{model}"
+           f":streamGenerateContent?alt=sse&key={key}")
+    started = time.monotonic()
+    ttft = None
+    text = ""
+    with http_client.post(url, json=body, stream=True,
+                          timeout=(10, GEMINI_STREAM_STALL_SECONDS)) as r:
+        if r.status_code == 429:
+            raise GeminiRateLimited(r.headers.get("Retry-After"))
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if cancel is not None and cancel.is_set():
+                raise RuntimeError("cancelled")
+            if time.monotonic() - started > GEMINI_STREAM_MAX_SECONDS:
+                raise RuntimeError("stream took too long")
+            if not line.startswith(b"data:"):
+                continue
+            piece = _parts_text(json.loads(line[5:]))
+            if not piece:
+                continue
+            if ttft is None:
+                ttft = time.monotonic() - started
+            text += piece
+            problem = check_post_text(text, final=False)
+            if problem:
+                raise RuntimeError(f"off-format stream ({problem})")
+    text = text.strip()
+    problem = check_post_text(text)
+    if problem:
+        raise RuntimeError(f"off-format response ({problem})")
+    return text, ttft if ttft is not None else time.monotonic() - started
+
+def record_gemini_call(entry: dict):
+    """Append one call's timings to cache/gemini_calls.jsonl."""
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(CACHE_DIR / "gemini_calls.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print("Could not record Gemini call:", e)
+
+def recent_gemini_calls(limit: int = 200) -> list:
+    try:
+        with open(CACHE_DIR / "gemini_calls.jsonl", encoding="utf-8") as f:
+            lines = deque(f, maxlen=limit)
+    except OSError:
+        return []
+    calls = []
+    for line in lines:
+        try:
+            calls.append(json.loads(line))
+        except ValueError:
+            continue
+    return calls
 
-def generate_text_with_gemini(topic_title: str, mode: str) -> str:
+def gemini_hedge_delay() -> float | None:
+    """
+    Seconds to wait on the first key before hedging on a second one: the
+    GEMINI_HEDGE_PERCENTILE of recent successful call times. None when
+    hedging is off, history is too thin, or today's hedge budget is spent.
+    """
+    if GEMINI_HEDGE_PERCENTILE <= 0:
+        return None
+    calls = recent_gemini_calls()
+    day_ago = time.time() - 86400
+    if sum(1 for c in calls if c.get("hedge") and c.get("ts", 0) > day_ago) >= GEMINI_HEDGE_DAILY_BUDGET:
+        return None
+    times = sorted(c["total"] for c in calls[-50:] if c.get("ok") and "total" in c)
+    if len(times) < GEMINI_HEDGE_MIN_SAMPLES:
+        return None
+    return times[min(len(times) - 1, int(GEMINI_HEDGE_PERCENTILE * len(times)))]
+
+gemini_text_cache = DiskCache(CACHE_DIR / "gemini", GEMINI_CACHE_MAX_MB * 1024 * 1024)
+
+def gemini_cache_key(model: str, mode: str, topic_title: str, prompt: str) -> str:
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return json.dumps([model, mode, topic_title.strip(), prompt_hash])
+
+def generate_text_with_gemini(topic_title: str, mode: str, use_cache: bool = True) -> str:
     """
     Use Gemini to generate LinkedIn-ready text:
     - Greeting line
     - 3–5 bullet points with emojis
     - Optional 'Caption:' line
     - Hashtags at the end
+
+    Results are memoized on disk by (model, mode, topic, prompt hash);
+    pass use_cache=False or set GEMINI_CACHE_BYPASS=1 to force a fresh call.
     """
-    api_keys = [k.strip() for k in os.getenv("GEMINI_KEYS", "").split(",") if k.strip()]
-    if not api_keys:
-        raise RuntimeError("No GEMINI_KEYS set in .env")
+    pool = get_gemini_key_pool()
 
     if mode == "article":
         post_type_desc = "a short LinkedIn explainer post"
@@ -103,28 +818,87 @@ def generate_text_with_gemini(topic_title: str, mode: str) -> str:
     model = "gemini-2.5-flash"
     last_error = None
 
-    for key in api_keys:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={key}"
+    cache_key = gemini_cache_key(model, mode, topic_title, prompt)
+    use_cache = use_cache and not GEMINI_CACHE_BYPASS
+    if use_cache:
+        cached = gemini_text_cache.read_json(cache_key)
+        if cached and cached.get("text"):
+            print("Text: using cached Gemini generation.")
+            return cached["text"]
+
+    call_gemini = stream_gemini_text if GEMINI_STREAM else request_gemini_text
+    cancel = threading.Event()
+
+    def attempt(key: str, hedge: bool) -> tuple:
+        """One call on one key; returns (text or None, error)."""
+        started = time.monotonic()
+        call = {"ts": time.time(), "key": pool.key_id(key), "mode": mode,
+                "stream": GEMINI_STREAM, "hedge": hedge}
+        error = None
         try:
-            r = requests.post(url, json=body, timeout=60)
-            if r.status_code == 429:
-                print("Text: key rate-limited, trying next Gemini key...")
-                last_error = "rate-limited"
-                continue
-            r.raise_for_status()
-            data = r.json()
-            chunks = []
-            for cand in data.get("candidates", []):
-                for part in cand.get("content", {}).get("parts", []):
-                    if "text" in part:
-                        chunks.append(part["text"])
-            text = "\n".join(chunks).strip()
+            text, ttft = call_gemini(key, model, body, cancel)
+            total = time.monotonic() - started
+            call.update(ttft=round(ttft, 3), total=round(total, 3))
             if text:
-                return text
+                pool.report_success(key, total)
+                record_gemini_call({**call, "ok": True})
+                return text, None
+            pool.report_error(key, total)
+            error = "empty response"
+        except GeminiRateLimited as e:
+            print("Text: key rate-limited, trying next Gemini key...")
+            pool.report_rate_limited(key, e.retry_after)
+            error = "rate-limited"
         except Exception as e:
-            print("Gemini text error with one key:", e)
-            last_error = str(e)
-            continue
+            if cancel.is_set():
+                error = "cancelled"
+            else:
+                print("Gemini text error with one key:", e)
+                pool.report_error(key, time.monotonic() - started)
+                error = str(e)
+        call.setdefault("total", round(time.monotonic() - started, 3))
+        record_gemini_call({**call, "ok": False, "error": error})
+        return None, error
+
+    # Keys are tried one after another; if the one in flight is slower than
+    # the learned hedge delay, a second key is raced against it once.
+    queue = pool.ordered()
+    hedge_delay = gemini_hedge_delay() if len(queue) > 1 else None
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    executor = ThreadPoolExecutor(max_workers=2)
+    running = {}
+
+    def launch(hedge: bool = False):
+        key = queue.pop(0)
+        running[submit_in_context(executor, attempt, key, hedge)] = time.monotonic()
+
+    try:
+        launch()
+        while running:
+            timeout = None
+            if hedge_delay is not None and len(running) == 1 and queue:
+                timeout = max(0.0, next(iter(running.values())) + hedge_delay - time.monotonic())
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                print(f"Text: no answer after {hedge_delay:.1f}s, hedging on another key...")
+                hedge_delay = None
+                launch(hedge=True)
+                continue
+            for fut in done:
+                running.pop(fut)
+                text, error = fut.result()
+                if text:
+                    if use_cache:
+                        gemini_text_cache.write_json(cache_key, {"text": text, "created": time.time()})
+                    return text
+                last_error = error
+            if not running and queue:
+                launch()
+    finally:
+        # The loser of a hedge is told to stop and never waited for: a stream
+        # aborts mid-generation, a blocking call closes once its answer lands
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
 
     print("All Gemini keys failed for text, using fallback. Last error:", last_error)
     return (
@@ -199,16 +973,61 @@ def generate_text_with_gemini(topic_title: str, mode: str) -> str:
 
 #     print("All Gemini keys failed for image, last error:", last_error)
 #     return False
-def generate_image_with_nvidia(prompt: str, out_path: Path):
+def decode_b64_json_field(chunks, field: str, out) -> int:
+    """
+    Stream-decode the base64 string `field` of a JSON document into `out`.
+
+    `chunks` is an iterable of bytes (e.g. Response.iter_content()); only
+    one chunk plus a few undecoded characters are held at a time, so the
+    full document is never buffered. Returns the number of bytes written.
+    """
+    key = re.compile(rb'"' + re.escape(field.encode()) + rb'"\s*:\s*"')
+    buf, carry, esc = b"", b"", b""
+    in_value = False
+    written = 0
+    for chunk in chunks:
+        buf += chunk
+        if not in_value:
+            m = key.search(buf)
+            if not m:
+                # Keep a tail in case the key straddles two chunks
+                buf = buf[-(len(field) + 32):]
+                continue
+            in_value = True
+            buf = buf[m.end():]
+
+        end = buf.find(b'"')
+        raw = esc + (buf if end < 0 else buf[:end])
+        buf, esc = b"", b""
+        if end < 0 and raw.endswith(b"\\"):
+            raw, esc = raw[:-1], b"\\"
+        # JSON may escape "/" and wrap long strings
+        data = carry + raw.replace(b"\\/", b"/").replace(b"\\n", b"").replace(b"\\r", b"")
+        usable = len(data) - len(data) % 4
+        written += out.write(base64.b64decode(data[:usable]))
+        carry = data[usable:]
+        if end >= 0:
+            if carry:
+                written += out.write(base64.b64decode(carry + b"=" * (-len(carry) % 4)))
+            return written
+
+    if in_value:
+        raise RuntimeError(f"Response ended inside the '{field}' field")
+    raise RuntimeError(f"No '{field}' field in response")
+
+nim_image_cache = DiskCache(CACHE_DIR / "images", NIM_CACHE_MAX_MB * 1024 * 1024, suffix=".png")
+
+def generate_image_with_nvidia(prompt: str, out_path: Path, use_cache: bool = True):
     """
     Generate an image using NVIDIA NIM (Stable Diffusion 3 Medium).
 
     Requires:
       - NVIDIA_API_KEY in your environment
-    """
-    if not NVIDIA_API_KEY:
-        raise RuntimeError("NVIDIA_API_KEY not set in environment")
 
+    The seed is fixed, so the same prompt + parameters always give the same
+    image; results are kept in cache/images keyed by a hash of the request
+    and hard-linked into out_path on a hit (NIM_CACHE_BYPASS=1 to skip).
+    """
     url = "https://ai.api.nvidia.com/v1/genai/stabilityai/stable-diffusion-3-medium"
 
     headers = {
@@ -225,31 +1044,44 @@ def generate_image_with_nvidia(prompt: str, out_path: Path):
         "negative_prompt": ""
     }
 
-    print("Calling NVIDIA NIM image API...")
-    r = requests.post(url, headers=headers, json=payload, timeout=60)
-    r.raise_for_status()
-    data = r.json()
+    cache_key = json.dumps([url, payload], sort_keys=True)
+    use_cache = use_cache and not NIM_CACHE_BYPASS
+    if use_cache:
+        cached = nim_image_cache.get_path(cache_key)
+        if cached:
+            link_or_copy(cached, out_path)
+            print("NVIDIA NIM image served from cache:", out_path)
+            return
 
-    # NIM returns base64-encoded PNG under "image" for SD3 Medium :contentReference[oaicite:2]{index=2}
-    image_b64 = data.get("image")
-    if not image_b64:
-        raise RuntimeError("NIM: no 'image' field in response")
+    if not NVIDIA_API_KEY:
+        raise RuntimeError("NVIDIA_API_KEY not set in environment")
 
-    img_bytes = base64.b64decode(image_b64)
-    with open(out_path, "wb") as f:
-        f.write(img_bytes)
+    print("Calling NVIDIA NIM image API...")
+    # NIM returns base64-encoded PNG under "image" for SD3 Medium :contentReference[oaicite:2]{index=2}
+    # It is decoded straight into the file as the body streams in.
+    tmp = out_path.with_name(out_path.name + ".part")
+    try:
+        with http_client.post(url, headers=headers, json=payload, timeout=60, stream=True) as r:
+            r.raise_for_status()
+            with open(tmp, "wb") as f:
+                size = decode_b64_json_field(r.iter_content(64 * 1024), "image", f)
+        if not size:
+            raise RuntimeError("NIM: empty 'image' field in response")
+        # Never write through a hard link into the cache
+        os.replace(tmp, out_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    if use_cache:
+        nim_image_cache.put_file(cache_key, out_path)
 
     print("NVIDIA NIM image saved:", out_path)
 
-from PIL import Image, ImageDraw, ImageFont
-import textwrap, random
-from pathlib import Path
-
 def fallback_image(topic_title: str, out_path: Path):
     """
     Fully compatible fallback — never fails on old Pillow.
     Draws centered-ish wrapped text without measuring size.
     """
+    from PIL import Image, ImageDraw, ImageFont
 
     # Pleasant background colors
     colors = [
@@ -300,6 +1132,66 @@ def fallback_image(topic_title: str, out_path: Path):
     img.save(out_path)
     print("Saved ultra-compatible fallback banner image.")
 
+# ---------- Pre-upload image optimization ----------
+
+IMAGE_CONTENT_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".gif": "image/gif"}
+
+def _psnr(a: Image.Image, b: Image.Image) -> float:
+    from PIL import ImageChops, ImageStat
+    diff = ImageChops.difference(a, b.convert("RGB"))
+    mse = sum(ImageStat.Stat(diff).sum2) / (a.width * a.height * 3)
+    return 99.0 if mse == 0 else min(99.0, 10 * math.log10(255 ** 2 / mse))
+
+def optimize_image(src: Path, min_psnr: float = IMAGE_MIN_PSNR,
+                   jpeg_quality: int = IMAGE_JPEG_QUALITY) -> dict:
+    """
+    Re-encode src as the smallest of: optimized PNG, 256-colour palette PNG
+    and JPEG, skipping lossy results below `min_psnr`. The winner is written
+    next to src as upload.<ext> (src itself is never modified, it may be a
+    hard link into the image cache). WebP is not tried: LinkedIn's asset
+    upload only takes JPEG, PNG and GIF.
+    """
+    from PIL import Image
+    original = src.stat().st_size
+    with Image.open(src) as im:
+        rgb = im.convert("RGB")
+
+    options = []
+
+    def encode(fmt, img, **kwargs):
+        buf = io.BytesIO()
+        img.save(buf, fmt, **kwargs)
+        return buf.getvalue()
+
+    options.append(("png", ".png", encode("PNG", rgb, optimize=True), 99.0))
+    palette = rgb.quantize(colors=256)
+    options.append(("png-palette", ".png", encode("PNG", palette, optimize=True), _psnr(rgb, palette)))
+    jpeg = encode("JPEG", rgb, quality=jpeg_quality, optimize=True, progressive=True)
+    with Image.open(io.BytesIO(jpeg)) as decoded:
+        options.append(("jpeg", ".jpg", jpeg, _psnr(rgb, decoded)))
+
+    # Encodings from an earlier run must not be mistaken for this one's
+    for stale in src.parent.glob("upload.*"):
+        if stale != src:
+            stale.unlink(missing_ok=True)
+
+    acceptable = [o for o in options if o[3] >= min_psnr]
+    if not acceptable:
+        print(f"Image optimization: nothing reaches PSNR {min_psnr} dB, uploading the original.")
+        return {"original_bytes": original, "psnr": 99.0, "format": "original",
+                "file": src.name, "optimized_bytes": original}
+    name, ext, data, psnr = min(acceptable, key=lambda o: len(o[2]))
+    result = {"original_bytes": original, "psnr": round(psnr, 2)}
+    if len(data) >= original:
+        result.update(format="original", file=src.name, optimized_bytes=original)
+        return result
+
+    out = src.with_name("upload" + ext)
+    out.write_bytes(data)
+    result.update(format=name, file=out.name, optimized_bytes=len(data))
+    print(f"Image optimized: {original} -> {len(data)} bytes ({name}, PSNR {psnr:.1f} dB)")
+    return result
+
 # ---------- Trending topic (Hacker News) ----------
 
 # import random
@@ -369,135 +1261,535 @@ def fallback_image(topic_title: str, out_path: Path):
 #     except Exception as e:
 #         print("Hacker News fetch failed, using fallback topic. Error:", e)
 #         return random.choice(fallback_topics)
-import random, time
-import requests
-from pathlib import Path
+# ---------- Topic history index ----------
+
+_TRACKING_PARAMS = {"ref", "ref_src", "fbclid", "gclid", "mc_cid", "mc_eid", "source", "smid"}
+
+def normalize_url(url: str) -> str:
+    """Scheme-less, www-less URL with tracking params and fragments removed."""
+    parts = urlsplit((url or "").strip())
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m.", "old."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/")
+    return host + path + ("?" + urlencode(query) if query else "")
+
+def normalize_title(title: str) -> str:
+    """Lowercase ASCII-folded words, punctuation stripped."""
+    text = unicodedata.normalize("NFKD", title or "").encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
 
-def fetch_trending_topic(limit: int = 50):
+class TopicIndex:
     """
-    Get a trending tech topic from live sources:
-      1) Hacker News top stories
-      2) Reddit /r/technology top (day)
-    Avoids repeating the last used title.
-    Falls back to a generic topic only if both fail.
+    Near-duplicate index over every archive/<id>/meta.json.
+
+    Titles are reduced to MinHash signatures of 4-char shingles and bucketed
+    with LSH bands, so a lookup only compares against the handful of past
+    posts that share a band. Exact matches on the normalized URL are caught
+    by a plain dict. The index is persisted to archive/topic_index.json and
+    topped up from any folders it hasn't seen yet on load. One lock guards
+    the entries, buckets and file writes, since batch drafts are archived
+    from several threads at once.
     """
 
-    # Remember last used topic to avoid repetition
-    last_title = None
-    last_path = ARCHIVE_DIR / "last_topic.txt"
-    if last_path.exists():
+    def __init__(self, archive_dir: Path, num_perm: int = 64, bands: int = 16,
+                 threshold: float = TOPIC_DUP_THRESHOLD):
+        self.archive_dir = archive_dir
+        self.path = archive_dir / "topic_index.json"
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        # XOR with a random mask stands in for a hash permutation; it's ~4x
+        # cheaper than (a*h + b) mod p and keeps lookups well under 1 ms
+        rng = random.Random(20240601)
+        self._masks = [rng.getrandbits(64) for _ in range(num_perm)]
+        self._sig_cache = OrderedDict()  # title -> signature, see signature_matrix()
+        self._lock = threading.RLock()
+        self.entries = {}
+        self._by_url = {}
+        self._buckets = {}
+
+    def signature(self, title: str) -> list:
+        return self.signature_matrix([title])[0].tolist()
+
+    def signature_matrix(self, titles: list):
+        """
+        MinHash signatures of many titles in one NumPy pass, as a
+        (len(titles), num_perm) uint64 array. Recent results are kept, so
+        ranking candidates right after the duplicate check costs nothing.
+        """
+        import numpy as np
+        with self._lock:
+            return self._signature_matrix(np, titles)
+
+    def _signature_matrix(self, np, titles: list):
+        missing = [t for t in dict.fromkeys(titles) if t not in self._sig_cache]
+        if missing:
+            digests, starts = [], []
+            for title in missing:
+                norm = normalize_title(title)
+                starts.append(len(digests))
+                digests.extend(hashlib.blake2b(sh.encode(), digest_size=8).digest()
+                               for sh in {norm[i:i + 4] for i in range(max(1, len(norm) - 3))})
+            hashes = np.frombuffer(b"".join(digests), dtype=">u8").astype(np.uint64)
+            masks = np.array(self._masks, dtype=np.uint64)
+            # (num_perm, shingles) keeps each reduceat segment contiguous
+            sigs = np.minimum.reduceat(masks[:, None] ^ hashes[None, :], starts, axis=1).T
+            for title, sig in zip(missing, sigs):
+                self._sig_cache[title] = sig
+            while len(self._sig_cache) > 4096:
+                self._sig_cache.popitem(last=False)
+        return np.stack([self._sig_cache[t] for t in titles])
+
+    def _band_keys(self, sig: list):
+        for b in range(self.bands):
+            yield (b, tuple(sig[b * self.rows:(b + 1) * self.rows]))
+
+    def _insert(self, post_id: str, url_key: str, sig: list):
+        with self._lock:
+            self.entries[post_id] = {"url": url_key, "sig": sig}
+            if url_key:
+                self._by_url[url_key] = post_id
+            for key in self._band_keys(sig):
+                self._buckets.setdefault(key, set()).add(post_id)
+
+    def load(self) -> "TopicIndex":
         try:
-            last_title = last_path.read_text(encoding="utf-8").strip()
-        except Exception:
-            last_title = None
-
-    # ---------- 1) Try Hacker News ----------
-    try:
-        print("Trying Hacker News for trending topic...")
-        ids_resp = requests.get(
-            "https://hacker-news.firebaseio.com/v0/topstories.json",
-            timeout=20,
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("num_perm") == self.num_perm:
+                for post_id, e in data.get("entries", {}).items():
+                    self._insert(post_id, e["url"], e["sig"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        added = 0
+        for meta_path in self.archive_dir.glob("*/meta.json"):
+            post_id = meta_path.parent.name
+            if post_id in self.entries:
+                continue
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            self.add(post_id, meta.get("title", ""), meta.get("url", ""), save=False)
+            added += 1
+        if added:
+            self.save()
+        return self
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique temp name: other processes may be saving the same index
+        tmp = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with self._lock:
+            tmp.write_text(json.dumps({"num_perm": self.num_perm, "entries": self.entries}),
+                           encoding="utf-8")
+            os.replace(tmp, self.path)
+
+    def add(self, post_id: str, title: str, url: str, save: bool = True):
+        with self._lock:
+            self._insert(post_id, normalize_url(url) if url else "", self.signature(title))
+            if save:
+                self.save()
+
+    def signatures_since(self, day: str) -> dict:
+        """Snapshot of {post_id: signature} for posts dated `day` (YYYYMMDD) or later."""
+        with self._lock:
+            return {pid: e["sig"] for pid, e in self.entries.items() if pid[:8] >= day}
+
+    def find_duplicate(self, title: str, url: str = "") -> str | None:
+        """Return the id of a past post that matches this topic, if any."""
+        url_key = normalize_url(url) if url else ""
+        with self._lock:
+            if url_key and url_key in self._by_url:
+                return self._by_url[url_key]
+            sig = self.signature(title)
+            seen = set()
+            for key in self._band_keys(sig):
+                for post_id in self._buckets.get(key, ()):
+                    if post_id in seen:
+                        continue
+                    seen.add(post_id)
+                    other = self.entries[post_id]["sig"]
+                    similar = sum(1 for x, y in zip(sig, other) if x == y) / self.num_perm
+                    if similar >= self.threshold:
+                        return post_id
+        return None
+
+
+_topic_index = None
+
+def get_topic_index() -> TopicIndex:
+    global _topic_index
+    if _topic_index is None:
+        _topic_index = TopicIndex(ARCHIVE_DIR).load()
+    return _topic_index
+
+def fetch_hn_items(ids, deadline: float, workers: int = HN_FETCH_WORKERS) -> list:
+    """
+    Fetch HN item documents through a bounded thread pool.
+    Stops waiting at `deadline` (time.monotonic() value) and returns
+    whatever items arrived by then, in the original id order.
+    """
+    def fetch_one(id_):
+        remaining = max(1.0, deadline - time.monotonic())
+        # Ranking divides score and comment count by the story's current age,
+        # so items are only trusted for a few minutes. After that the ETag
+        # lets an unchanged item come back as a body-less 304.
+        return response_cache.get_json(
+            f"https://hacker-news.firebaseio.com/v0/item/{id_}.json",
+            ttl=HN_ITEM_TTL_SECONDS,
+            headers={"X-Firebase-ETag": "true"},
+            timeout=min(20, remaining),
         )
-        ids_resp.raise_for_status()
-        ids = ids_resp.json()
 
-        candidates = []
-        for id_ in ids[:limit]:
+    from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+    items = {}
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = {submit_in_context(pool, fetch_one, id_): id_ for id_ in ids}
+    try:
+        for fut in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
             try:
-                item_resp = requests.get(
-                    f"https://hacker-news.firebaseio.com/v0/item/{id_}.json",
-                    timeout=20,
-                )
-                item_resp.raise_for_status()
-                item = item_resp.json()
-
-                title = item.get("title", "")
-                url = item.get("url") or f"https://news.ycombinator.com/item?id={id_}"
-
-                # Ignore very short titles
-                if len(title) < 20:
-                    continue
-
-                # Skip if same as last used topic
-                if last_title and title.strip() == last_title:
-                    print("Skipping repeated HN topic:", title)
-                    continue
-
-                candidates.append({
-                    "title": title,
-                    "url": url,
-                    "score": item.get("score", 0),
-                    "source": "Hacker News",
-                })
+                item = fut.result()
             except Exception as e:
                 print("Error fetching HN item, skipping:", e)
                 continue
+            if item:
+                items[futures[fut]] = item
+    except FuturesTimeout:
+        print(f"HN fetch budget exhausted, got {len(items)} of {len(futures)} items.")
+    finally:
+        # Don't block on stragglers; their results are simply dropped.
+        pool.shutdown(wait=False, cancel_futures=True)
 
-        if candidates:
-            # Random pick from filtered candidates (still trending)
-            random.shuffle(candidates)
-            chosen = random.choice(candidates)
-            print("Using HN topic:", chosen["title"])
-            # Save for next run so we don't repeat
-            last_path.write_text(chosen["title"], encoding="utf-8")
-            return chosen
+    return [items[id_] for id_ in ids if id_ in items]
 
-        print("No suitable HN topics (after filtering), moving to Reddit...")
-    except Exception as e:
-        print("Hacker News fetch failed:", e)
+class TopicSource:
+    """
+    A place trending topics come from. Subclasses set `name` and implement
+    fetch(limit, deadline) -> list of candidate dicts (title, url, score,
+    comments, time); `deadline` is a time.monotonic() value the source must
+    not run past. `budget` is how many seconds it gets.
+    """
 
-    # ---------- 2) Try Reddit /r/technology ----------
-    try:
-        print("Trying Reddit /r/technology for trending topic...")
+    name = "source"
+
+    def __init__(self, budget: float | None = None):
+        self.budget = TOPIC_SOURCE_BUDGET_SECONDS if budget is None else budget
+
+    def fetch(self, limit: int, deadline: float) -> list:
+        raise NotImplementedError
+
+
+class HackerNewsSource(TopicSource):
+    name = "Hacker News"
+
+    def __init__(self, budget: float = HN_FETCH_BUDGET_SECONDS):
+        super().__init__(budget)
+
+    def fetch(self, limit: int, deadline: float) -> list:
+        # Firebase only sends an ETag when asked for one
+        ids = response_cache.get_json(
+            "https://hacker-news.firebaseio.com/v0/topstories.json",
+            headers={"X-Firebase-ETag": "true"},
+            timeout=min(20, max(1.0, deadline - time.monotonic())),
+        )
+        return [{
+            "title": item.get("title", ""),
+            "url": item.get("url") or f"https://news.ycombinator.com/item?id={item.get('id')}",
+            "score": item.get("score", 0),
+            "comments": item.get("descendants", 0),
+            "time": item.get("time"),
+        } for item in fetch_hn_items(ids[:limit], deadline)]
+
+
+class RedditSource(TopicSource):
+    def __init__(self, subreddit: str = "technology", budget: float | None = None):
+        super().__init__(budget)
+        self.subreddit = subreddit
+        self.name = f"Reddit /r/{subreddit}"
+
+    def fetch(self, limit: int, deadline: float) -> list:
         headers = {
             "User-Agent": "TecBeeBot/0.1 (by your-email-or-username)"
         }
-        r = requests.get(
-            "https://www.reddit.com/r/technology/top.json?t=day&limit=20",
+        data = response_cache.get_json(
+            f"https://www.reddit.com/r/{self.subreddit}/top.json?t=day&limit={min(limit, 100)}",
             headers=headers,
-            timeout=20,
+            timeout=max(1.0, deadline - time.monotonic()),
         )
-        r.raise_for_status()
-        data = r.json()
-        posts = data.get("data", {}).get("children", [])
-
         candidates = []
-        for p in posts:
+        for p in data.get("data", {}).get("children", []):
             d = p.get("data", {})
-            title = d.get("title", "")
-            url = (
-                d.get("url_overridden_by_dest")
-                or d.get("url")
-                or "https://www.reddit.com" + d.get("permalink", "")
-            )
+            candidates.append({
+                "title": d.get("title", ""),
+                "url": (
+                    d.get("url_overridden_by_dest")
+                    or d.get("url")
+                    or "https://www.reddit.com" + d.get("permalink", "")
+                ),
+                "score": d.get("score", 0),
+                "comments": d.get("num_comments", 0),
+                "time": d.get("created_utc"),
+            })
+        return candidates
 
+
+class FeedSource(TopicSource):
+    """Any RSS 2.0 or Atom feed. Feeds carry no votes, so score is 0."""
+
+    ATOM = "{http://www.w3.org/2005/Atom}"
+
+    def __init__(self, url: str, budget: float | None = None):
+        super().__init__(budget)
+        self.url = url
+        self.name = f"Feed {urlsplit(url).hostname}"
+
+    @staticmethod
+    def _timestamp(text: str | None) -> float | None:
+        from email.utils import parsedate_to_datetime
+        if not text:
+            return None
+        text = text.strip()
+        try:
+            return datetime.datetime.fromisoformat(text.replace("Z", "+00:00")).timestamp()  # Atom
+        except ValueError:
+            pass
+        try:
+            return parsedate_to_datetime(text).timestamp()  # RSS
+        except (TypeError, ValueError):
+            return None
+
+    def fetch(self, limit: int, deadline: float) -> list:
+        import xml.etree.ElementTree as ET
+        r = http_client.get(self.url, timeout=max(1.0, deadline - time.monotonic()))
+        r.raise_for_status()
+        root = ET.fromstring(r.content)
+        candidates = []
+        for item in root.iter("item"):  # RSS
+            candidates.append({
+                "title": (item.findtext("title") or "").strip(),
+                "url": (item.findtext("link") or "").strip(),
+                "score": 0,
+                "comments": 0,
+                "time": self._timestamp(item.findtext("pubDate")),
+            })
+        for entry in root.iter(self.ATOM + "entry"):
+            links = entry.findall(self.ATOM + "link")
+            link = next((l for l in links if l.get("rel", "alternate") == "alternate"), links[0] if links else None)
+            candidates.append({
+                "title": (entry.findtext(self.ATOM + "title") or "").strip(),
+                "url": link.get("href", "") if link is not None else "",
+                "score": 0,
+                "comments": 0,
+                "time": self._timestamp(entry.findtext(self.ATOM + "published")
+                                        or entry.findtext(self.ATOM + "updated")),
+            })
+        return candidates[:limit]
+
+
+# TOPIC_SOURCES entries are "<type>" or "<type>:<argument>"; add a type by
+# registering a factory taking that argument (may be "") here.
+TOPIC_SOURCE_TYPES = {
+    "hn": lambda arg: HackerNewsSource(),
+    "reddit": lambda arg: RedditSource(arg or "technology"),
+    "feed": lambda arg: FeedSource(arg),
+}
+
+def get_topic_sources(spec: str = TOPIC_SOURCES) -> list:
+    sources = []
+    for entry in spec.replace(",", " ").split():
+        kind, _, arg = entry.partition(":")
+        factory = TOPIC_SOURCE_TYPES.get(kind)
+        if factory is None:
+            print(f"Unknown topic source {entry!r}, skipping.")
+            continue
+        sources.append(factory(arg))
+    return sources
+
+def fetch_topic_candidates(limit: int = TOPIC_CANDIDATES, sources: list | None = None) -> list:
+    """
+    Query every topic source (TOPIC_SOURCES) at the same time and merge
+    their candidates into one pool. Each source only gets its own budget:
+    it is asked to stop at its deadline and return what it has, and one
+    that is still silent TOPIC_SOURCE_GRACE_SECONDS later is dropped, so a
+    slow or down source never holds up the others. Skips short titles, anything that near-duplicates
+    a post already in the archive, and the same story seen on two sources
+    (first source in TOPIC_SOURCES wins).
+    Returns an empty list if every source fails.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    sources = get_topic_sources() if sources is None else sources
+    if not sources:
+        return []
+
+    def run(source, deadline):
+        with span("topic_source", source=source.name):
+            return source.fetch(limit, deadline)
+
+    started = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=len(sources))
+    # Keyed by position: two feeds on one host share a display name
+    futures, results = {}, {}
+    try:
+        for i, source in enumerate(sources):
+            deadline = started + source.budget
+            futures[submit_in_context(pool, run, source, deadline)] = (i, deadline + TOPIC_SOURCE_GRACE_SECONDS)
+        pending = set(futures)
+        while pending:
+            next_cutoff = min(futures[f][1] for f in pending)
+            done, pending = wait(pending, timeout=max(0.0, next_cutoff - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = futures[fut][0]
+                try:
+                    results[i] = fut.result()
+                    print(f"{sources[i].name}: {len(results[i])} topics "
+                          f"in {time.monotonic() - started:.1f}s")
+                except Exception as e:
+                    print(f"{sources[i].name} fetch failed:", e)
+            now = time.monotonic()
+            for fut in [f for f in pending if futures[f][1] <= now]:
+                source = sources[futures[fut][0]]
+                print(f"{source.name} missed its {source.budget:g}s deadline, skipping.")
+                pending.discard(fut)
+    finally:
+        # Don't block on stragglers; their results are simply dropped.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # Past posts, to avoid repeating a story (even reworded)
+    history = get_topic_index()
+    seen = set()
+    candidates = []
+    for i, source in enumerate(sources):
+        for c in results.get(i, []):
+            title, url = c.get("title", ""), c.get("url", "")
+
+            # Ignore very short titles
             if len(title) < 20:
                 continue
 
-            # Skip if same as last used topic
-            if last_title and title.strip() == last_title:
-                print("Skipping repeated Reddit topic:", title)
+            # Same story from an earlier source
+            keys = {normalize_title(title), normalize_url(url) if url else None} - {None}
+            if keys & seen:
                 continue
+            seen |= keys
 
-            candidates.append({
-                "title": title,
-                "url": url,
-                "score": d.get("score", 0),
-                "source": "Reddit /r/technology",
-            })
+            # Skip if we already posted this story
+            dup = history.find_duplicate(title, url)
+            if dup:
+                print(f"Skipping repeated {source.name} topic:", title, f"(matches {dup})")
+                continue
 
-        if candidates:
-            random.shuffle(candidates)
-            chosen = random.choice(candidates)
-            print("Using Reddit topic:", chosen["title"])
-            last_path.write_text(chosen["title"], encoding="utf-8")
-            return chosen
+            candidates.append({**c, "source": source.name})
 
-        print("No suitable Reddit topics found.")
-    except Exception as e:
-        print("Reddit fetch failed:", e)
+    if not candidates:
+        print("No suitable topics from any source.")
+    return candidates
 
-    # ---------- 3) Last-resort fallback ----------
+# ---------- Topic ranking ----------
+
+def rank_topics(candidates: list, k: int = 5, history: TopicIndex | None = None,
+                now: float | None = None) -> list:
+    """
+    Score every candidate in one NumPy pass and return the best `k`, each
+    with a "rank" dict: total score, per-signal contributions and a
+    one-line "why". Signals (weights in TOPIC_RANK_WEIGHTS):
+
+      velocity  points per hour since posting (log, scaled to the batch max)
+      comments  comment count (log, scaled to the batch max)
+      title     closeness of the title length to TOPIC_TITLE_CHARS
+      source    TOPIC_SOURCE_WEIGHTS[source]
+      novelty   penalty: MinHash similarity to the closest post from the
+                last TOPIC_NOVELTY_DAYS days
+    """
+    import numpy as np
+
+    if not candidates:
+        return []
+    history = history or get_topic_index()
+    now = now or time.time()
+    w = TOPIC_RANK_WEIGHTS
+
+    score = np.array([float(c.get("score") or 0) for c in candidates])
+    comments = np.array([float(c.get("comments") or 0) for c in candidates])
+    posted = np.array([float(c.get("time") or np.nan) for c in candidates])
+    title_len = np.array([len(c["title"]) for c in candidates], dtype=float)
+    source = np.array([TOPIC_SOURCE_WEIGHTS.get(c["source"], 1.0) for c in candidates])
+
+    age_h = np.clip((now - posted) / 3600, 0, None)
+    # No timestamp (e.g. a feed without dates): assume a typical age
+    age_h = np.where(np.isnan(age_h), np.nanmedian(age_h) if np.isfinite(age_h).any() else 12.0, age_h)
+    velocity = score / (age_h + 2)
+
+    def scaled(x):
+        x = np.log1p(x)
+        top = x.max()
+        return x / top if top > 0 else np.zeros_like(x)
+
+    parts = {
+        "velocity": w["velocity"] * scaled(velocity),
+        "comments": w["comments"] * scaled(comments),
+        "title": w["title"] * np.exp(-((title_len - TOPIC_TITLE_CHARS) / 35) ** 2),
+        "source": w["source"] * source,
+    }
+
+    # Novelty: compare signatures against recent posts only
+    cutoff = (datetime.date.today() - datetime.timedelta(days=TOPIC_NOVELTY_DAYS)).strftime("%Y%m%d")
+    recent_sigs = history.signatures_since(cutoff)
+    recent = list(recent_sigs)
+    similar = np.zeros(len(candidates))
+    closest = [None] * len(candidates)
+    if recent:
+        cand_sigs = history.signature_matrix([c["title"] for c in candidates])
+        past_sigs = np.array(list(recent_sigs.values()), dtype=np.uint64)
+        sim = (cand_sigs[:, None, :] == past_sigs[None, :, :]).mean(axis=2)  # (candidates, recent)
+        best = sim.argmax(axis=1)
+        similar = sim[np.arange(len(candidates)), best]
+        closest = [recent[i] for i in best]
+    parts["novelty"] = -w["novelty"] * similar
+
+    total = sum(parts.values())
+    k = min(k, len(candidates))
+    top = np.argpartition(-total, k - 1)[:k]
+    top = top[np.argsort(-total[top], kind="stable")]
+
+    ranked = []
+    for i in top:
+        contrib = {name: round(float(v[i]), 3) for name, v in parts.items()}
+        why = (f"{velocity[i]:.1f} pts/h over {age_h[i]:.0f}h ({contrib['velocity']:+.2f}), "
+               f"{int(comments[i])} comments ({contrib['comments']:+.2f}), "
+               f"{int(title_len[i])}-char title ({contrib['title']:+.2f}), "
+               f"{candidates[i]['source']} ({contrib['source']:+.2f})")
+        if similar[i] > 0:
+            why += f", {similar[i]:.0%} like {closest[i]} ({contrib['novelty']:+.2f})"
+        ranked.append({**candidates[i], "rank": {"score": round(float(total[i]), 3), "parts": contrib, "why": why}})
+    return ranked
+
+def fetch_trending_topic(limit: int = TOPIC_CANDIDATES):
+    """
+    Get the best-ranked trending tech topic from live sources (see
+    fetch_topic_candidates and rank_topics).
+    Falls back to a generic topic only if every source fails.
+    """
+    candidates = fetch_topic_candidates(limit)
+    if candidates:
+        ranked = rank_topics(candidates)
+        for r in ranked:
+            print(f"  {r['rank']['score']:+.2f} {r['title']} -- {r['rank']['why']}")
+        chosen = ranked[0]
+        print(f"Using {chosen['source']} topic:", chosen["title"])
+        return chosen
+
+    # ---------- Last-resort fallback ----------
     print("All live sources failed, using generic fallback topic.")
     fallback = {
         "title": "Latest trends and breakthroughs in modern technology",
@@ -505,17 +1797,16 @@ def fetch_trending_topic(limit: int = 50):
         "score": 0,
         "source": "fallback",
     }
-    try:
-        last_path.write_text(fallback["title"], encoding="utf-8")
-    except Exception:
-        pass
     return fallback
 
 # ---------- Day-of-week mode rotation ----------
 
 def get_mode_for_today() -> str:
+    return get_mode_for_date(datetime.date.today())
+
+def get_mode_for_date(day: datetime.date) -> str:
     # Monday=0, Sunday=6
-    weekday = datetime.datetime.now().weekday()
+    weekday = day.weekday()
     if weekday == 0:   # Mon
         return "article"
     if weekday == 1:   # Tue
@@ -533,24 +1824,242 @@ def get_mode_for_today() -> str:
 
 # ---------- Email helpers ----------
 
-def send_email(to_address: str, subject: str, body_text: str, body_html: str | None = None):
-    msg = MIMEMultipart("alternative")
-    msg["From"] = EMAIL_USER
-    msg["To"] = to_address
-    msg["Subject"] = subject
-
-    # Plain text part (always)
-    part1 = MIMEText(body_text, "plain")
-    msg.attach(part1)
+class MailOutbox:
+    """
+    Disk-backed mail queue: one JSON file per message in cache/outbox/,
+    drained by a background thread over a single authenticated SMTP
+    connection that is reused across messages. A failed send drops the
+    connection and retries the message with exponential backoff; after
+    EMAIL_MAX_ATTEMPTS it is moved to outbox/failed/. Mail left behind by an
+    earlier process goes out with the next one.
+    """
 
-    # Optional HTML part
-    if body_html:
-        part2 = MIMEText(body_html, "html")
-        msg.attach(part2)
+    CLAIM_STALE_SECONDS = 600
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._smtp = None
+        self._last_used = 0.0
+        self._mine = set()  # ids enqueued by this process
+
+    def enqueue(self, to_address: str, subject: str, body_text: str, body_html: str | None = None) -> str:
+        msg_id = f"{time.time_ns()}-{uuid.uuid4().hex[:6]}"
+        self._mine.add(msg_id)
+        self._write(self.root / f"{msg_id}.json", {
+            "id": msg_id, "from": EMAIL_USER, "to": to_address, "subject": subject,
+            "text": body_text, "html": body_html,
+            "queued": time.time(), "attempts": 0, "next_try": 0,
+        })
+        metrics.inc("tecbee_mail_queued_total", 1, "E-mails put in the outbox")
+        self.start()
+        self._wake.set()
+        return msg_id
+
+    def pending(self) -> list:
+        if not self.root.exists():
+            return []
+        return sorted(self.root.glob("*.json")) + sorted(self.root.glob("*.sending-*"))
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._release_stale_claims()
+            self._thread = threading.Thread(target=self._run, name="mail-outbox", daemon=True)
+            self._thread.start()
+
+    def flush(self, timeout: float = EMAIL_FLUSH_SECONDS) -> bool:
+        """
+        Wait up to `timeout` for the mail this process queued (True once it
+        has all gone out). Messages backing off past the deadline aren't
+        waited for; they stay on disk for the next run.
+        """
+        if not self._mine:
+            return True
+        self.start()
+        end = time.monotonic() + timeout
+        while self.unsent(time.time() + max(0.0, end - time.monotonic())):
+            if time.monotonic() >= end:
+                return False
+            self._wake.set()
+            time.sleep(0.05)
+        return not self.unsent()
+
+    def unsent(self, due_by: float | None = None) -> list:
+        """This process's queued messages, optionally only those due to be tried by `due_by`."""
+        waiting = []
+        for path in self.pending():
+            if path.name.split(".")[0] not in self._mine:
+                continue
+            if due_by is not None and path.suffix == ".json":
+                try:
+                    if json.loads(path.read_text(encoding="utf-8")).get("next_try", 0) > due_by:
+                        continue
+                except (OSError, ValueError):
+                    pass
+            waiting.append(path)
+        return waiting
+
+    # --- sender thread ---
+
+    def _run(self):
+        while True:
+            try:
+                due, wait_for = self._due()
+                for path in due:
+                    self._send_one(path)
+            except Exception as e:  # the sender must outlive any one bad pass
+                print("Outbox sender error:", e)
+                due, wait_for = [], EMAIL_RETRY_BASE_SECONDS
+            if due:
+                continue
+            if self._smtp is not None and time.monotonic() - self._last_used > EMAIL_SMTP_IDLE_SECONDS:
+                self._disconnect()
+            self._wake.wait(min(wait_for, EMAIL_SMTP_IDLE_SECONDS))
+            self._wake.clear()
+
+    def _due(self) -> tuple:
+        now, due, wait_for = time.time(), [], 3600.0
+        for path in sorted(self.root.glob("*.json")) if self.root.exists() else []:
+            try:
+                next_try = json.loads(path.read_text(encoding="utf-8")).get("next_try", 0)
+            except (OSError, ValueError):
+                continue  # half-written or claimed by someone else meanwhile
+            if next_try <= now:
+                due.append(path)
+            else:
+                wait_for = min(wait_for, next_try - now)
+        return due, wait_for
+
+    def _send_one(self, path: Path):
+        claimed = path.with_name(f"{path.name}.sending-{os.getpid()}")
+        try:
+            os.rename(path, claimed)  # another process may be draining the same outbox
+        except OSError:
+            return
+        try:
+            os.utime(claimed)
+            entry = json.loads(claimed.read_text(encoding="utf-8"))
+            started = time.perf_counter()
+            try:
+                self._deliver(entry)
+            except Exception as e:
+                self._disconnect()
+                self._retry_later(path, entry, e)
+            else:
+                metrics.inc("tecbee_mail_sent_total", 1, "E-mails handed to the SMTP server")
+                metrics.observe("tecbee_smtp_send_seconds", time.perf_counter() - started, "SMTP send latency")
+                print(f"E-mail sent: {entry['subject']}")
+            claimed.unlink(missing_ok=True)
+        except (OSError, ValueError) as e:
+            print("Outbox entry unreadable, leaving it for the next run:", claimed.name, e)
+
+    def _retry_later(self, path: Path, entry: dict, error: Exception):
+        import smtplib
+        entry["attempts"] += 1
+        entry["error"] = f"{type(error).__name__}: {error}"[:500]
+        metrics.inc("tecbee_mail_failures_total", 1, "Failed SMTP send attempts")
+        if entry["attempts"] >= EMAIL_MAX_ATTEMPTS or isinstance(error, smtplib.SMTPRecipientsRefused):
+            self._write(self.root / "failed" / path.name, entry)
+            print(f"E-mail '{entry['subject']}' given up after {entry['attempts']} attempt(s): {entry['error']}")
+            return
+        delay = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * 2 ** (entry["attempts"] - 1))
+        delay *= random.uniform(0.8, 1.2)
+        entry["next_try"] = time.time() + delay
+        self._write(path, entry)
+        print(f"E-mail '{entry['subject']}' failed ({entry['error']}), retry {entry['attempts']} in {delay:.0f}s")
+
+    def _deliver(self, entry: dict):
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
+        msg = MIMEMultipart("alternative")
+        msg["From"] = entry["from"]
+        msg["To"] = entry["to"]
+        msg["Subject"] = entry["subject"]
+
+        # Plain text part (always)
+        msg.attach(MIMEText(entry["text"], "plain"))
+
+        # Optional HTML part
+        if entry.get("html"):
+            msg.attach(MIMEText(entry["html"], "html"))
+
+        self._connection().sendmail(entry["from"], [entry["to"]], msg.as_string())
+        self._last_used = time.monotonic()
+
+    def _connection(self):
+        import smtplib
+        if self._smtp is not None:
+            if time.monotonic() - self._last_used < 5:
+                return self._smtp
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._disconnect()
+        import ssl
+        context = ssl.create_default_context()
+        if EMAIL_SMTP_PORT == 465:
+            smtp = smtplib.SMTP_SSL(EMAIL_SMTP, EMAIL_SMTP_PORT, timeout=HTTP_TIMEOUT, context=context)
+        else:
+            smtp = smtplib.SMTP(EMAIL_SMTP, EMAIL_SMTP_PORT, timeout=HTTP_TIMEOUT)
+            if EMAIL_SMTP_STARTTLS:
+                smtp.starttls(context=context)
+        if EMAIL_USER and EMAIL_PASS:
+            smtp.login(EMAIL_USER, EMAIL_PASS)
+        metrics.inc("tecbee_smtp_connections_total", 1, "SMTP connections opened")
+        self._smtp = smtp
+        return smtp
+
+    def _disconnect(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except Exception:
+                smtp.close()
+
+    def _release_stale_claims(self):
+        """Put back messages claimed by a process that died mid-send."""
+        if not self.root.exists():
+            return
+        for claimed in self.root.glob("*.sending-*"):
+            try:
+                if time.time() - claimed.stat().st_mtime > self.CLAIM_STALE_SECONDS:
+                    os.rename(claimed, claimed.with_name(claimed.name.split(".sending-")[0]))
+            except OSError:
+                pass
+
+    @staticmethod
+    def _write(path: Path, entry: dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(entry), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+_outbox = None
+
+def get_outbox() -> MailOutbox:
+    global _outbox
+    if _outbox is None:
+        _outbox = MailOutbox(CACHE_DIR / "outbox")
+    return _outbox
+
+def flush_outbox(timeout: float = EMAIL_FLUSH_SECONDS):
+    """Give queued mail a bounded chance to go out before the process exits."""
+    if _outbox is None or _outbox.flush(timeout):
+        return
+    print(f"{len(_outbox.unsent())} e-mail(s) still queued in {_outbox.root}; the next run will send them.")
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as s:
-        s.login(EMAIL_USER, EMAIL_PASS)
-        s.sendmail(EMAIL_USER, [to_address], msg.as_string())
+def send_email(to_address: str, subject: str, body_text: str, body_html: str | None = None) -> str:
+    """Queue a message for the outbox sender; returns immediately with its id."""
+    return get_outbox().enqueue(to_address, subject, body_text, body_html)
 
 def send_preview_email(preview_id: str, title: str):
     preview_url = f"http://127.0.0.1:5000/preview/{preview_id}"
@@ -611,26 +2120,117 @@ to post to LinkedIn at the scheduled time.
     )
 
 
+class ApprovalWatcher:
+    """
+    Collects 'APPROVE <id>' replies from the INBOX of one IMAP connection.
+
+    The server narrows candidates with SEARCH SUBJECT, only the Subject
+    header is fetched (BODY.PEEK, so nothing gets marked as read), and the
+    highest UID seen plus every approved id are kept in
+    cache/imap_state.json, so later checks only look at newer mail and an
+    early approval for a future draft is not lost.
+    """
+
+    def __init__(self, client: IMAPClient, state_path: Path):
+        self.client = client
+        self.state_path = state_path
+        info = client.select_folder("INBOX", readonly=True)
+        self.uidvalidity = info.get(b"UIDVALIDITY", 0)
+        self.use_idle = client.has_capability("IDLE")
+        self.last_uid = 0
+        self.approved = []
+        try:
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+            if state.get("uidvalidity") == self.uidvalidity:
+                self.last_uid = int(state.get("last_uid", 0))
+                self.approved = list(state.get("approved", []))
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def connect(cls) -> "ApprovalWatcher":
+        from imapclient import IMAPClient
+        M = IMAPClient(EMAIL_IMAP, ssl=True)
+        M.login(EMAIL_USER, EMAIL_PASS)
+        return cls(M, CACHE_DIR / "imap_state.json")
+
+    def _save(self):
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            self.state_path.write_text(json.dumps({
+                "uidvalidity": self.uidvalidity,
+                "last_uid": self.last_uid,
+                "approved": self.approved[-200:],
+            }), encoding="utf-8")
+        except OSError as e:
+            print("Could not save IMAP state:", e)
+
+    def refresh(self):
+        """Pick up approvals that arrived since the last call."""
+        criteria = ["SUBJECT", "APPROVE"]
+        if self.last_uid:
+            criteria = ["UID", f"{self.last_uid + 1}:*"] + criteria
+        # "n:*" always matches the newest message, even if its UID is below n
+        uids = [u for u in self.client.search(criteria) if u > self.last_uid]
+        if not uids:
+            return
+
+        fetched = self.client.fetch(uids, ["BODY.PEEK[HEADER.FIELDS (SUBJECT)]"])
+        for data in fetched.values():
+            raw = data.get(b"BODY[HEADER.FIELDS (SUBJECT)]", b"")
+            subj = str(make_header(decode_header(email.message_from_bytes(raw).get("Subject") or "")))
+            for approved_id in re.findall(r"APPROVE\s+([A-Z0-9-]+)", subj.upper()):
+                if approved_id not in self.approved:
+                    self.approved.append(approved_id)
+        self.last_uid = max(uids)
+        self._save()
+
+    def is_approved(self, preview_id: str) -> bool:
+        return preview_id.upper() in self.approved
+
+    def wait(self, timeout: float):
+        """
+        Block until the mailbox changes or `timeout` passes. With IDLE any
+        untagged response (new mail, expunge...) wakes us up; otherwise
+        this is a plain sleep capped at IMAP_POLL_SECONDS.
+        """
+        if timeout <= 0:
+            return
+        if not self.use_idle:
+            time.sleep(min(timeout, IMAP_POLL_SECONDS))
+            return
+        self.client.idle()
+        try:
+            self.client.idle_check(timeout=min(timeout, IMAP_IDLE_SECONDS))
+        finally:
+            self.client.idle_done()
+
+    def close(self):
+        try:
+            self.client.logout()
+        except Exception:
+            pass
+
+
 def poll_for_approval(preview_id: str, deadline_dt: datetime.datetime) -> bool:
-    M = imaplib.IMAP4_SSL(EMAIL_IMAP)
-    M.login(EMAIL_USER, EMAIL_PASS)
+    """
+    Wait until an 'APPROVE <id>' reply arrives or the deadline passes.
+    Uses IMAP IDLE so new mail is pushed to us; servers without IDLE are
+    polled every IMAP_POLL_SECONDS instead.
+    """
+    watcher = ApprovalWatcher.connect()
     try:
+        if not watcher.use_idle:
+            print("IMAP server has no IDLE, polling instead.")
         while datetime.datetime.now() < deadline_dt:
-            M.select("INBOX")
-            typ, data = M.search(None, "UNSEEN")
-            if typ == "OK":
-                for num in data[0].split():
-                    typ2, msg_data = M.fetch(num, "(RFC822)")
-                    raw = msg_data[0][1]
-                    mail = email.message_from_bytes(raw)
-                    subj = (mail.get("Subject") or "").upper()
-                    if f"APPROVE {preview_id}".upper() in subj:
-                        print("Approval email detected.")
-                        return True
-            time.sleep(30)
+            watcher.refresh()
+            if watcher.is_approved(preview_id):
+                print("Approval email detected.")
+                return True
+            watcher.wait((deadline_dt - datetime.datetime.now()).total_seconds())
         return False
     finally:
-        M.logout()
+        watcher.close()
 
 def send_summary_email(success: bool, title: str, topic_url: str):
     status = "SUCCESS" if success else "NOT POSTED"
@@ -644,7 +2244,7 @@ def send_summary_email(success: bool, title: str, topic_url: str):
 
 # ---------- Flask preview ----------
 
-app = Flask(__name__)
+_preview_app = None
 
 TEMPLATE = """
 <!doctype html>
@@ -657,38 +2257,175 @@ TEMPLATE = """
 """
 
 
-@app.route("/preview/<id_>")
-def preview(id_):
+_preview_template = None
+_preview_cache = OrderedDict()  # id -> rendered page, see render_preview()
+_preview_lock = threading.Lock()
+
+def render_preview(id_: str) -> dict | None:
+    """
+    Rendered preview page for archive/<id_>, cached in memory.
+    An entry is reused until the folder, meta.json or text.txt mtime
+    changes; it holds the HTML, its gzip form and an ETag.
+    """
+    global _preview_template
     folder = ARCHIVE_DIR / id_
-    if not folder.exists():
-        return "Not found", 404
-    meta = json.loads((folder / "meta.json").read_text())
-    text = (folder / "text.txt").read_text(encoding="utf-8")
-    return render_template_string(
-        TEMPLATE,
+    try:
+        mtimes = (folder.stat().st_mtime_ns,
+                  (folder / "meta.json").stat().st_mtime_ns,
+                  (folder / "text.txt").stat().st_mtime_ns)
+    except OSError:
+        # Compacted posts are read from their month's pack
+        packed = archive_packs.signature(id_)
+        if packed is None:
+            return None
+        mtimes = (packed,)
+
+    with _preview_lock:
+        page = _preview_cache.get(id_)
+        if page and page["mtimes"] == mtimes:
+            _preview_cache.move_to_end(id_)
+            return page
+
+    if _preview_template is None:
+        _preview_template = get_preview_app().jinja_env.from_string(TEMPLATE)
+    meta = json.loads(read_post_file(id_, "meta.json"))
+    text = read_post_file(id_, "text.txt").decode("utf-8")
+    html_bytes = _preview_template.render(
         post_id=id_,
         title=meta["title"],
         src_url=meta["url"],
         text=text,
-    )
+    ).encode("utf-8")
+    page = {
+        "mtimes": mtimes,
+        "html": html_bytes,
+        "gzip": gzip.compress(html_bytes),
+        "etag": hashlib.sha1(html_bytes).hexdigest(),
+        "last_modified": datetime.datetime.fromtimestamp(max(mtimes) / 1e9, datetime.timezone.utc),
+    }
+    with _preview_lock:
+        _preview_cache[id_] = page
+        _preview_cache.move_to_end(id_)
+        while len(_preview_cache) > 128:
+            _preview_cache.popitem(last=False)
+    return page
 
 
-@app.route("/archive/<id_>/<filename>")
+def preview(id_):
+    from flask import request, Response
+    page = render_preview(id_)
+    if page is None:
+        return "Not found", 404
+    use_gzip = "gzip" in request.accept_encodings
+    resp = Response(page["gzip"] if use_gzip else page["html"], mimetype="text/html")
+    if use_gzip:
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.set_etag(page["etag"] + ("-gz" if use_gzip else ""))
+    resp.last_modified = page["last_modified"]
+    # Drafts can still change, so always revalidate (cheap 304s)
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+
+def metrics_endpoint():
+    from flask import Response
+    body = metrics.render()
+    # Connection reuse lives in HttpClient; sample it at scrape time
+    stats = http_client.stats()
+    lines = ["# HELP tecbee_http_connections_opened New upstream connections opened",
+             "# TYPE tecbee_http_connections_opened gauge"]
+    lines += [f'tecbee_http_connections_opened{{host="{h}"}} {v["opened"]}' for h, v in sorted(stats["hosts"].items())]
+    lines += ["# HELP tecbee_http_connections_reused Upstream requests served on a pooled connection",
+              "# TYPE tecbee_http_connections_reused gauge"]
+    lines += [f'tecbee_http_connections_reused{{host="{h}"}} {v["reused"]}' for h, v in sorted(stats["hosts"].items())]
+    return Response(body + "\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
 def serve_file(id_, filename):
+    from flask import request, Response, send_from_directory
     folder = ARCHIVE_DIR / id_
-    return send_from_directory(folder, filename)
+    if not (folder / filename).is_file():
+        packed = archive_packs.entry(id_, filename)
+        if packed is None:
+            return "Not found", 404
+        offset, length, ctype = packed
+        resp = Response(archive_packs.read(id_, filename), mimetype=ctype)
+        resp.set_etag(f"{id_}-{offset}-{length}")
+        resp.cache_control.max_age = PREVIEW_FILE_MAX_AGE
+        resp.cache_control.public = True
+        return resp.make_conditional(request)
+    # send_from_directory adds ETag / Last-Modified and answers conditional requests
+    resp = send_from_directory(folder, filename, max_age=PREVIEW_FILE_MAX_AGE)
+    resp.cache_control.public = True
+    return resp
+
+def get_preview_app():
+    """The Flask app behind the preview links, built on first use."""
+    global _preview_app
+    if _preview_app is None:
+        from flask import Flask
+        app = Flask(__name__)
+        app.add_url_rule("/preview/<id_>", view_func=preview)
+        app.add_url_rule("/metrics", view_func=metrics_endpoint)
+        app.add_url_rule("/archive/<id_>/<filename>", view_func=serve_file)
+        _preview_app = app
+    return _preview_app
+
+def serve_preview(port: int = 5000):
+    """Serve the preview app with waitress (multi-threaded); blocks."""
+    from waitress import serve as waitress_serve
+    waitress_serve(get_preview_app(), host="127.0.0.1", port=port, threads=PREVIEW_THREADS)
 
 def start_preview_server():
-    threading.Thread(
-        target=lambda: app.run(port=5000, debug=False, use_reloader=False),
-        daemon=True
-    ).start()
+    """Serve the preview app in the background."""
+    threading.Thread(target=serve_preview, daemon=True).start()
 
 # ---------- LinkedIn image upload + post ----------
 
-def upload_image_to_linkedin(image_path: Path) -> str:
+class RateLimiter:
+    """Spaces calls at least `min_interval` seconds apart (thread-safe)."""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_s = self._next - now
+            self._next = max(now, self._next) + self.min_interval
+        if wait_s > 0:
+            time.sleep(wait_s)
+
+
+def load_linkedin_accounts() -> list:
+    """
+    Accounts to publish to, as dicts with name / urn / token.
+
+    Read from LINKEDIN_ACCOUNTS_FILE (a JSON list; each entry gives either
+    "token" or "token_env", the name of an env var holding the token) so
+    member and organization URNs can be mixed. Without that file this is
+    just the LINKEDIN_ACCESS_TOKEN / LINKEDIN_PERSON_URN pair.
+    """
+    if LINKEDIN_ACCOUNTS_FILE.exists():
+        accounts = []
+        for i, a in enumerate(json.loads(LINKEDIN_ACCOUNTS_FILE.read_text(encoding="utf-8"))):
+            token = a.get("token") or os.getenv(a.get("token_env", ""), "")
+            if not token or not a.get("urn"):
+                print(f"LinkedIn account #{i} is missing a token or urn, skipping.")
+                continue
+            accounts.append({"name": a.get("name") or a["urn"], "urn": a["urn"], "token": token})
+        return accounts
+    return [{"name": "default", "urn": LINKEDIN_PERSON_URN, "token": LINKEDIN_ACCESS_TOKEN}]
+
+
+def upload_image_to_linkedin(image_path: Path, access_token: str | None = None,
+                             owner_urn: str | None = None, limiter: RateLimiter | None = None) -> str:
+    access_token = access_token or LINKEDIN_ACCESS_TOKEN
+    owner_urn = owner_urn or LINKEDIN_PERSON_URN
     headers = {
-        "Authorization": f"Bearer {LINKEDIN_ACCESS_TOKEN}",
+        "Authorization": f"Bearer {access_token}",
         "X-Restli-Protocol-Version": "2.0.0",
         "Content-Type": "application/json"
     }
@@ -696,41 +2433,44 @@ def upload_image_to_linkedin(image_path: Path) -> str:
     register_body = {
         "registerUploadRequest": {
             "recipes": ["urn:li:digitalmediaRecipe:feedshare-image"],
-            "owner": LINKEDIN_PERSON_URN,
+            "owner": owner_urn,
             "serviceRelationships": [{
                 "relationshipType": "OWNER",
                 "identifier": "urn:li:userGeneratedContent"
             }]
         }
     }
-    r = requests.post(register_url, headers=headers, json=register_body)
+    if limiter:
+        limiter.acquire()
+    r = http_client.post(register_url, headers=headers, json=register_body)
     r.raise_for_status()
     data = r.json()
     upload_mech = data["value"]["uploadMechanism"]["com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest"]
     upload_url = upload_mech["uploadUrl"]
     asset_urn = data["value"]["asset"]
 
-    with open(image_path, "rb") as f:
-        img_bytes = f.read()
-
     upload_headers = {
-        "Authorization": f"Bearer {LINKEDIN_ACCESS_TOKEN}",
-        "Content-Type": "image/png"
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": IMAGE_CONTENT_TYPES.get(Path(image_path).suffix.lower(), "image/png")
     }
-    r2 = requests.put(upload_url, headers=upload_headers, data=img_bytes)
+    if limiter:
+        limiter.acquire()
+    # Stream the body from a read-only mmap of the file (served from the
+    # page cache); requests sets Content-Length from its size.
+    with open(image_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        r2 = http_client.put(upload_url, headers=upload_headers, data=view)
     r2.raise_for_status()
     return asset_urn
 
-def post_to_linkedin(title: str, full_text: str, image_path: Path) -> bool:
-    asset_urn = upload_image_to_linkedin(image_path)
-
+def create_linkedin_post(title: str, full_text: str, asset_urn: str, access_token: str | None = None,
+                         author_urn: str | None = None, limiter: RateLimiter | None = None) -> requests.Response:
     headers = {
-        "Authorization": f"Bearer {LINKEDIN_ACCESS_TOKEN}",
+        "Authorization": f"Bearer {access_token or LINKEDIN_ACCESS_TOKEN}",
         "X-Restli-Protocol-Version": "2.0.0",
         "Content-Type": "application/json"
     }
     body = {
-        "author": LINKEDIN_PERSON_URN,
+        "author": author_urn or LINKEDIN_PERSON_URN,
         "lifecycleState": "PUBLISHED",
         "specificContent": {
             "com.linkedin.ugc.ShareContent": {
@@ -749,42 +2489,389 @@ def post_to_linkedin(title: str, full_text: str, image_path: Path) -> bool:
         }
     }
     url = "https://api.linkedin.com/v2/ugcPosts"
-    r = requests.post(url, headers=headers, json=body)
+    if limiter:
+        limiter.acquire()
+    return http_client.post(url, headers=headers, json=body)
+
+def post_to_linkedin(title: str, full_text: str, image_path: Path) -> bool:
+    asset_urn = upload_image_to_linkedin(image_path)
+    r = create_linkedin_post(title, full_text, asset_urn)
     print("LinkedIn post status:", r.status_code, r.text)
     return r.ok
 
-# ---------- Main ----------
+def publish_to_accounts(title: str, full_text: str, image_path: Path,
+                        accounts: list | None = None) -> dict:
+    """
+    Publish one draft to every account concurrently: each account registers
+    its own asset, uploads and posts on its own thread, throttled by its own
+    RateLimiter, so the total is roughly the slowest account, not the sum.
+    """
+    accounts = accounts if accounts is not None else load_linkedin_accounts()
 
-def main():
-    now = datetime.datetime.now()
-    if now.hour < 6:
-        print("Too early (<06:00), exiting.")
-        return
+    def publish_one(account):
+        started = time.monotonic()
+        result = {"name": account["name"], "urn": account["urn"], "ok": False}
+        limiter = RateLimiter(LINKEDIN_MIN_INTERVAL)
+        try:
+            asset_urn = upload_image_to_linkedin(image_path, account["token"], account["urn"], limiter)
+            r = create_linkedin_post(title, full_text, asset_urn, account["token"], account["urn"], limiter)
+            result.update(ok=r.ok, status=r.status_code, post_id=r.headers.get("x-restli-id"))
+            if not r.ok:
+                result["error"] = r.text[:500]
+        except Exception as e:
+            result["error"] = str(e)
+        result["seconds"] = round(time.monotonic() - started, 3)
+        print(f"LinkedIn [{account['name']}]:", "posted" if result["ok"] else f"failed ({result.get('error')})")
+        return result
+
+    started = time.monotonic()
+    results = []
+    if accounts:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(accounts)) as pool:
+            results = [f.result() for f in [submit_in_context(pool, publish_one, a) for a in accounts]]
+    return {
+        "ok": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "seconds": round(time.monotonic() - started, 3),
+        "accounts": results,
+    }
 
-    mode = get_mode_for_today()
-    if mode == "none":
-        print("Sunday: skipping auto-post.")
-        return
+# ---------- Archive packs ----------
 
-    start_preview_server()
+class ArchivePacks:
+    """
+    Old archive folders packed into one file per month.
 
-    topic = fetch_trending_topic()
-    title = topic["title"]
-    url = topic["url"]
-    print("Chosen topic:", title, url, "mode:", mode)
+    archive/packs/YYYYMM.pack is the files' bytes back to back;
+    YYYYMM.idx.json maps post id -> file name -> [offset, length, content type].
+    Reads go through a read-only mmap of the pack, so the preview routes can
+    serve packed posts without unpacking anything.
+    """
 
-    text = generate_text_with_gemini(title, mode)
+    CONTENT_TYPES = {".json": "application/json", ".txt": "text/plain; charset=utf-8",
+                     ".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
 
-    folder_id = now.strftime("%Y%m%d") + "-" + uuid.uuid4().hex[:6]
-    folder = ARCHIVE_DIR / folder_id
-    folder.mkdir(parents=True, exist_ok=True)
-    (folder / "meta.json").write_text(json.dumps({"title": title, "url": url}, indent=2))
-    (folder / "text.txt").write_text(text, encoding="utf-8")
+    def __init__(self, root: Path):
+        self.root = root
+        self._lock = threading.Lock()
+        self._indexes = {}  # month -> (idx mtime, index)
+        self._maps = {}     # month -> (pack size, mmap)
 
-    # ---------- IMAGE GENERATION (NVIDIA NIM) ----------
-    img_path = folder / "image.png"
+    def _paths(self, month: str) -> tuple:
+        return self.root / f"{month}.pack", self.root / f"{month}.idx.json"
+
+    def _index(self, month: str) -> dict:
+        _, idx_path = self._paths(month)
+        try:
+            mtime = idx_path.stat().st_mtime_ns
+        except OSError:
+            return {}
+        with self._lock:
+            cached = self._indexes.get(month)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            index = json.loads(idx_path.read_text(encoding="utf-8"))
+            self._indexes[month] = (mtime, index)
+            return index
+
+    def signature(self, id_: str):
+        """Changes whenever the post's pack is rewritten (None if not packed)."""
+        _, idx_path = self._paths(id_[:6])
+        if id_ not in self._index(id_[:6]):
+            return None
+        return idx_path.stat().st_mtime_ns
+
+    def ids(self) -> list:
+        out = []
+        for idx_path in sorted(self.root.glob("*.idx.json")):
+            out.extend(self._index(idx_path.name.split(".", 1)[0]))
+        return out
+
+    def entry(self, id_: str, name: str):
+        """(offset, length, content type) of a packed file, or None."""
+        e = self._index(id_[:6]).get(id_, {}).get(name)
+        return tuple(e) if e else None
+
+    def read(self, id_: str, name: str) -> bytes | None:
+        e = self.entry(id_, name)
+        if e is None:
+            return None
+        offset, length, _ = e
+        pack_path, _ = self._paths(id_[:6])
+        size = pack_path.stat().st_size
+        with self._lock:
+            cached = self._maps.get(id_[:6])
+            if cached is None or cached[0] != size:
+                if cached:
+                    cached[1].close()
+                with open(pack_path, "rb") as f:
+                    cached = (size, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                self._maps[id_[:6]] = cached
+            return cached[1][offset:offset + length]
+
+    def pack_folder(self, folder: Path, thumbnails: bool = ARCHIVE_PACK_THUMBNAILS) -> int:
+        """Append one folder to its month's pack. Returns the bytes written."""
+        id_ = folder.name
+        month = id_[:6]
+        pack_path, idx_path = self._paths(month)
+        self.root.mkdir(parents=True, exist_ok=True)
+        index = dict(self._index(month))
+        files = {}
+        written = 0
+        with open(pack_path, "ab") as pack:
+            offset = pack.tell()
+            for path in sorted(folder.iterdir()):
+                # upload.* is just a re-encoded copy of image.png
+                if not path.is_file() or path.stem == "upload" or path.suffix in (".tmp", ".part"):
+                    continue
+                data = path.read_bytes()
+                ctype = self.CONTENT_TYPES.get(path.suffix.lower(), "application/octet-stream")
+                if thumbnails and path.name == "image.png":
+                    from PIL import Image
+                    with Image.open(io.BytesIO(data)) as im:
+                        thumb = im.convert("RGB")
+                        thumb.thumbnail((ARCHIVE_THUMBNAIL_SIZE, ARCHIVE_THUMBNAIL_SIZE))
+                        buf = io.BytesIO()
+                        thumb.save(buf, "JPEG", quality=80, optimize=True)
+                    data, ctype = buf.getvalue(), "image/jpeg"
+                pack.write(data)
+                files[path.name] = [offset, len(data), ctype]
+                offset += len(data)
+                written += len(data)
+            pack.flush()
+            os.fsync(pack.fileno())
+        index[id_] = files
+        tmp = idx_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(index), encoding="utf-8")
+        os.replace(tmp, idx_path)
+        return written
+
+
+archive_packs = ArchivePacks(ARCHIVE_PACK_DIR)
+
+def read_post_file(id_: str, name: str) -> bytes | None:
+    """A file of an archived post, from its folder or from a pack."""
+    try:
+        return (ARCHIVE_DIR / id_ / name).read_bytes()
+    except OSError:
+        return archive_packs.read(id_, name)
+
+def compact_archive(max_age_days: int = ARCHIVE_PACK_AGE_DAYS,
+                    thumbnails: bool = ARCHIVE_PACK_THUMBNAILS) -> dict:
+    """
+    Move posts older than `max_age_days` (by folder date) into monthly packs
+    and delete their folders. Drafts still queued or awaiting approval are
+    left alone.
+    """
+    cutoff = (datetime.date.today() - datetime.timedelta(days=max_age_days)).strftime("%Y%m%d")
+    packed, freed, written = 0, 0, 0
+    for folder in sorted(ARCHIVE_DIR.glob("*")):
+        stamp = folder.name.split("-", 1)[0]
+        if not folder.is_dir() or not re.fullmatch(r"\d{8}", stamp) or stamp >= cutoff:
+            continue
+        try:
+            meta = json.loads((folder / "meta.json").read_text())
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get("status") in ("queued", "awaiting_approval"):
+            continue
+        size = sum(p.stat().st_size for p in folder.iterdir() if p.is_file())
+        written += archive_packs.pack_folder(folder, thumbnails)
+        shutil.rmtree(folder)
+        packed += 1
+        freed += size
+    print(f"Compacted {packed} posts: {freed} bytes in folders -> {written} bytes in packs.")
+    return {"posts": packed, "folder_bytes": freed, "pack_bytes": written}
+
+# ---------- Archive index (SQLite) ----------
+
+class ArchiveDB:
+    """
+    SQLite index over archive/<id>/ folders so history questions ("what did
+    we post last month", "which topics came from Reddit") are indexed
+    lookups instead of a walk over every meta.json. The folders stay the
+    source of truth: index_post() re-reads one post, rebuild() all of them
+    (folders and packs).
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS posts (
+        id             TEXT PRIMARY KEY,
+        date           TEXT NOT NULL,
+        scheduled_for  TEXT,
+        mode           TEXT,
+        source         TEXT,
+        title          TEXT,
+        url            TEXT,
+        status         TEXT,
+        posted_ok      INTEGER,
+        total_seconds  REAL,
+        timings        TEXT,
+        updated_at     REAL
+    );
+    CREATE INDEX IF NOT EXISTS posts_date ON posts(date);
+    CREATE INDEX IF NOT EXISTS posts_source_date ON posts(source, date);
+    CREATE INDEX IF NOT EXISTS posts_status_date ON posts(status, date);
+    CREATE INDEX IF NOT EXISTS posts_mode_date ON posts(mode, date);
+    CREATE INDEX IF NOT EXISTS posts_scheduled ON posts(scheduled_for);
+    """
+
+    def __init__(self, path: Path = ARCHIVE_DB_PATH, archive_dir: Path | None = None):
+        import sqlite3
+        self.archive_dir = archive_dir or path.parent
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self._lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _row_for(id_: str) -> dict | None:
+        try:
+            meta = json.loads(read_post_file(id_, "meta.json") or b"")
+        except ValueError:
+            return None
+        try:
+            timings = json.loads(read_post_file(id_, "timings.json") or b"{}")
+        except ValueError:
+            timings = {}
+        try:
+            date = datetime.datetime.strptime(id_.split("-", 1)[0], "%Y%m%d").date().isoformat()
+        except ValueError:
+            return None
+        total = max((t["start"] + t["seconds"] for t in timings.values()), default=None)
+        status = meta.get("status")
+        return {
+            "id": id_,
+            "date": date,
+            "scheduled_for": meta.get("scheduled_for"),
+            "mode": meta.get("mode"),
+            "source": meta.get("source"),
+            "title": meta.get("title"),
+            "url": meta.get("url"),
+            "status": status,
+            "posted_ok": None if status is None else int(status == "posted"),
+            "total_seconds": total,
+            "timings": json.dumps(timings) if timings else None,
+            "updated_at": time.time(),
+        }
+
+    def _upsert(self, row: dict):
+        cols = ", ".join(row)
+        marks = ", ".join(":" + c for c in row)
+        self.conn.execute(f"INSERT OR REPLACE INTO posts ({cols}) VALUES ({marks})", row)
+
+    def index_post(self, folder_id: str):
+        row = self._row_for(folder_id)
+        if row is None:
+            return
+        with self._lock, self.conn:
+            self._upsert(row)
+
+    def rebuild(self) -> int:
+        """Re-create the index from the folders on disk. Returns the post count."""
+        ids = {p.name for p in self.archive_dir.glob("*") if p.is_dir()} | set(archive_packs.ids())
+        rows = [r for r in map(self._row_for, ids) if r]
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM posts")
+            for row in rows:
+                self._upsert(row)
+        return len(rows)
+
+    def query(self, since: str | None = None, until: str | None = None, source: str | None = None,
+              status: str | None = None, mode: str | None = None, limit: int = 100) -> list:
+        """Posts matching every given filter, newest first (dates are ISO strings)."""
+        where, args = [], {}
+        for col, op, val in (("date", ">=", since), ("date", "<=", until), ("source", "=", source),
+                             ("status", "=", status), ("mode", "=", mode)):
+            if val is not None:
+                name = f"{col}_{len(args)}"
+                where.append(f"{col} {op} :{name}")
+                args[name] = val
+        sql = "SELECT * FROM posts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date DESC, id DESC LIMIT :limit"
+        args["limit"] = limit
+        with self._lock:
+            return [dict(r) for r in self.conn.execute(sql, args)]
+
+
+_archive_db = None
+
+def get_archive_db() -> ArchiveDB:
+    global _archive_db
+    if _archive_db is None:
+        _archive_db = ArchiveDB(ARCHIVE_DB_PATH, ARCHIVE_DIR)
+    return _archive_db
+
+def index_post(folder_id: str):
+    """Refresh one post's row; the index must never break the pipeline."""
     try:
-        image_prompt = f"""
+        get_archive_db().index_post(folder_id)
+    except Exception as e:
+        print("Archive index update failed:", e)
+
+# ---------- Stage graph ----------
+
+class StageGraph:
+    """
+    Tiny dependency-graph runner for pipeline stages.
+    Each stage is fn(results) -> value and starts as soon as all of its
+    deps have finished, so independent stages overlap on a thread pool.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name: str, fn, deps=()):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name!r} depends on unknown stage {dep!r}")
+        self.stages[name] = (fn, tuple(deps))
+        return self
+
+    def run(self, max_workers: int = 4) -> dict:
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        t0 = time.perf_counter()
+
+        def timed(name, fn):
+            start = time.perf_counter()
+            try:
+                with span(name):
+                    return fn(results)
+            finally:
+                self.timings[name] = {
+                    "start": round(start - t0, 3),
+                    "seconds": round(time.perf_counter() - start, 3),
+                }
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                ready = [n for n, (_, deps) in pending.items() if all(d in results for d in deps)]
+                for name in ready:
+                    fn, _ = pending.pop(name)
+                    running[submit_in_context(pool, timed, name, fn)] = name
+                if not running:
+                    raise RuntimeError(f"Stage graph is stuck: {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    # Re-raises the stage's exception; queued stages never start
+                    results[name] = fut.result()
+        return results
+
+# ---------- Draft generation ----------
+
+def build_image_prompt(title: str) -> str:
+    return f"""
 Professional, minimal, high-contrast tech artwork about:
 "{title}"
 
@@ -795,13 +2882,419 @@ Requirements:
 - No real faces
 - Should look good as a LinkedIn post visual
 """
-        generate_image_with_nvidia(image_prompt, img_path)
+
+def generate_post_image(title: str, img_path: Path) -> Path:
+    """NVIDIA NIM image, or the local fallback banner if NIM fails."""
+    try:
+        generate_image_with_nvidia(build_image_prompt(title), img_path)
     except Exception as e:
         print("NVIDIA NIM image error:", e)
+        img_path.unlink(missing_ok=True)
         fallback_image(title, img_path)
-    # ---------------------------------------------------
+    return img_path
+
+def generate_draft(mode: str, folder_id: str, topic: dict | None = None,
+                   send_preview: bool = True, meta: dict | None = None) -> dict:
+    """
+    Build one draft in archive/<folder_id>/ as a stage graph:
+
+        topic -> text  -> archive -> preview
+              -> image ----------->
+                     -> optimize (after archive; records sizes in meta.json)
+
+    Text and image generation only need the topic title, so they run in
+    parallel. Per-stage timings are written to timings.json, stage spans and
+    upstream calls to trace.jsonl. Extra `meta`
+    fields are merged into meta.json.
+    """
+    folder = ARCHIVE_DIR / folder_id
+    folder.mkdir(parents=True, exist_ok=True)
+    img_path = folder / "image.png"
+
+    def stage_topic(r):
+        chosen = topic or fetch_trending_topic()
+        print("Chosen topic:", chosen["title"], chosen["url"], "mode:", mode)
+        return chosen
+
+    def stage_archive(r):
+        title, url = r["topic"]["title"], r["topic"]["url"]
+        fields = {
+            "title": title,
+            "url": url,
+            "source": r["topic"].get("source", ""),
+            "mode": mode,
+            **(meta or {}),
+        }
+        (folder / "meta.json").write_text(json.dumps(fields, indent=2))
+        (folder / "text.txt").write_text(r["text"], encoding="utf-8")
+        get_topic_index().add(folder_id, title, url)
+        index_post(folder_id)
+        return folder
+
+    def stage_optimize(r):
+        if not IMAGE_OPTIMIZE:
+            return img_path
+        try:
+            info = optimize_image(img_path)
+        except Exception as e:
+            print("Image optimization failed, uploading original:", e)
+            return img_path
+        update_meta(folder_id, image_optimization=info)
+        return folder / info["file"]
+
+    graph = StageGraph()
+    graph.add("topic", stage_topic)
+    graph.add("text", lambda r: generate_text_with_gemini(r["topic"]["title"], mode), deps=["topic"])
+    graph.add("image", lambda r: generate_post_image(r["topic"]["title"], img_path), deps=["topic"])
+    graph.add("archive", stage_archive, deps=["topic", "text"])
+    if send_preview:
+        graph.add("preview", lambda r: send_preview_email(folder_id, r["topic"]["title"]),
+                  deps=["archive", "image"])
+    graph.add("optimize", stage_optimize, deps=["image", "archive"])
+
+    try:
+        with tracing(folder_id):
+            results = graph.run()
+    finally:
+        (folder / "timings.json").write_text(json.dumps(graph.timings, indent=2))
+        index_post(folder_id)
+
+    return {
+        "folder_id": folder_id,
+        "title": results["topic"]["title"],
+        "url": results["topic"]["url"],
+        "text": results["text"],
+        "image": img_path,
+        "upload": results["optimize"],
+    }
 
-    send_preview_email(folder_id, title)
+def load_draft(folder_id: str) -> dict:
+    """Same shape as generate_draft()'s result, read back from the archive."""
+    folder = ARCHIVE_DIR / folder_id
+    meta = json.loads((folder / "meta.json").read_text())
+    upload = folder / meta.get("image_optimization", {}).get("file", "image.png")
+    return {
+        "folder_id": folder_id,
+        "title": meta["title"],
+        "url": meta["url"],
+        "text": (folder / "text.txt").read_text(encoding="utf-8"),
+        "image": folder / "image.png",
+        "upload": upload if upload.exists() else folder / "image.png",
+    }
+
+def publish_draft(folder_id: str, summary: bool = True) -> bool:
+    """
+    Post an archived draft to every account, record the outcome in meta.json.
+    Accounts an earlier attempt already posted to are skipped, so re-running
+    after a partial failure only retries the ones that failed.
+    """
+    draft = load_draft(folder_id)
+    meta = json.loads((ARCHIVE_DIR / folder_id / "meta.json").read_text())
+    done = [a for a in meta.get("publish", {}).get("accounts", []) if a.get("ok")]
+    done_urns = {a["urn"] for a in done}
+    accounts = [a for a in load_linkedin_accounts() if a["urn"] not in done_urns]
+    if done:
+        print(f"{folder_id}: already posted to {len(done)} account(s), {len(accounts)} left.")
+    with tracing(folder_id), span("publish"):
+        report = publish_to_accounts(draft["title"], draft["text"], draft["upload"], accounts)
+    results = done + report["accounts"]
+    report.update(ok=sum(1 for r in results if r["ok"]), failed=sum(1 for r in results if not r["ok"]),
+                  accounts=results)
+    success = report["ok"] > 0 and report["failed"] == 0
+    update_meta(folder_id, status="posted" if success else "post_failed", publish=report)
+    if summary:
+        send_summary_email(success, draft["title"], draft["url"])
+    return success
+
+_meta_lock = threading.Lock()
+
+def update_meta(folder_id: str, **fields):
+    path = ARCHIVE_DIR / folder_id / "meta.json"
+    with _meta_lock:
+        meta = json.loads(path.read_text())
+        meta.update(fields)
+        path.write_text(json.dumps(meta, indent=2))
+    index_post(folder_id)
+
+# ---------- Batch (week-ahead) drafts ----------
+
+def find_handled_draft(day: datetime.date) -> str | None:
+    """
+    Folder id of a draft for `day` that is already waiting for approval or
+    done with (posted, failed, not approved), so the day must not get
+    another preview or post.
+    """
+    for meta_path in sorted(ARCHIVE_DIR.glob(day.strftime("%Y%m%d") + "-*/meta.json")):
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            continue
+        if meta.get("scheduled_for", day.isoformat()) == day.isoformat() \
+                and meta.get("status") in ("awaiting_approval", "posted", "post_failed", "not_approved"):
+            return meta_path.parent.name
+    return None
+
+def find_queued_draft(day: datetime.date) -> str | None:
+    """Folder id of a batch-generated draft scheduled for `day`, if any."""
+    for meta_path in sorted(ARCHIVE_DIR.glob(day.strftime("%Y%m%d") + "-*/meta.json")):
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            continue
+        if meta.get("status") == "queued" and meta.get("scheduled_for") == day.isoformat():
+            return meta_path.parent.name
+    return None
+
+def generate_batch(days: int = BATCH_DAYS, start: datetime.date | None = None,
+                   workers: int = BATCH_WORKERS) -> list:
+    """
+    Pre-generate drafts for the next `days` posting days (default: starting
+    tomorrow) so the morning run only has to get approval and post.
+
+    Topics are fetched once and spread across the days without repeats;
+    drafts are generated `workers` at a time and land in archive/ with
+    status "queued" and their scheduled date.
+    """
+    start = start or datetime.date.today() + datetime.timedelta(days=1)
+    schedule = []
+    for offset in range(days):
+        day = start + datetime.timedelta(days=offset)
+        mode = get_mode_for_date(day)
+        if mode == "none" or find_queued_draft(day):
+            continue
+        schedule.append((day, mode))
+    if not schedule:
+        print("Batch: nothing to generate.")
+        return []
+
+    # Best-ranked first, so the strongest topics are used
+    candidates = fetch_topic_candidates()
+    candidates = rank_topics(candidates, k=len(candidates))
+    # Keep the picks from duplicating each other, not just the archive
+    picked = TopicIndex(ARCHIVE_DIR)
+    topics = []
+    for c in candidates:
+        if len(topics) == len(schedule):
+            break
+        if picked.find_duplicate(c["title"], c["url"]):
+            continue
+        picked.add(str(len(topics)), c["title"], c["url"], save=False)
+        topics.append(c)
+    if len(topics) < len(schedule):
+        print(f"Batch: only {len(topics)} fresh topics for {len(schedule)} days.")
+        schedule = schedule[:len(topics)]
+
+    def build(day, mode, topic):
+        folder_id = day.strftime("%Y%m%d") + "-" + uuid.uuid4().hex[:6]
+        generate_draft(mode, folder_id, topic=topic, send_preview=False,
+                       meta={"status": "queued", "scheduled_for": day.isoformat()})
+        print(f"Batch: queued {folder_id} ({mode}) for {day}")
+        return folder_id
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    queued = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [submit_in_context(pool, build, day, mode, topic)
+                   for (day, mode), topic in zip(schedule, topics)]
+        for fut in as_completed(futures):
+            try:
+                queued.append(fut.result())
+            except Exception as e:
+                print("Batch: draft generation failed:", e)
+    return sorted(queued)
+
+# ---------- Scheduler daemon ----------
+
+def _at_hour(day: datetime.date, hour: int) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time(hour=hour))
+
+class PostScheduler:
+    """
+    Resident replacement for running main() once a day.
+
+    Work is kept on a timer heap of (when, action) entries: each day's
+    draft is prepared at DRAFT_HOUR, its approval window opens at POST_HOUR
+    and closes POST_GRACE_MINUTES later. Any number of drafts can be in
+    flight, each with its own times. Between timers the loop sleeps; while
+    at least one draft is waiting for approval it IDLEs on a single shared
+    IMAP connection instead, which is dropped again once nothing is waiting.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self.watching = {}  # folder_id -> approval deadline
+        self.watcher = None
+
+    def schedule(self, when: datetime.datetime, action, *args):
+        with self._lock:
+            heapq.heappush(self._heap, (when.timestamp(), next(self._seq), action, args))
+        self._wake.set()
+
+    def _pop_due(self):
+        with self._lock:
+            if self._heap and self._heap[0][0] <= time.time():
+                return heapq.heappop(self._heap)
+        return None
+
+    def _seconds_to_next(self) -> float:
+        with self._lock:
+            if not self._heap:
+                return 3600.0
+            return max(0.0, self._heap[0][0] - time.time())
+
+    # ----- actions -----
+
+    def prepare(self, day: datetime.date):
+        self.schedule(_at_hour(day + datetime.timedelta(days=1), DRAFT_HOUR), self.prepare,
+                      day + datetime.timedelta(days=1))
+        mode = get_mode_for_date(day)
+        if mode == "none":
+            print(f"Scheduler: no post on {day}.")
+            return
+        handled = find_handled_draft(day)
+        if handled:
+            print(f"Scheduler: {day} already has draft {handled}, skipping.")
+            return
+        folder_id = find_queued_draft(day)
+        if folder_id:
+            send_preview_email(folder_id, load_draft(folder_id)["title"])
+        else:
+            folder_id = day.strftime("%Y%m%d") + "-" + uuid.uuid4().hex[:6]
+            generate_draft(mode, folder_id, meta={"scheduled_for": day.isoformat()})
+        update_meta(folder_id, status="awaiting_approval", scheduled_for=day.isoformat())
+        self.schedule(_at_hour(day, POST_HOUR), self.open_window, folder_id, day)
+        print(f"Scheduler: {folder_id} previewed, posting window opens {_at_hour(day, POST_HOUR)}")
+
+    def open_window(self, folder_id: str, day: datetime.date):
+        deadline = _at_hour(day, POST_HOUR) + datetime.timedelta(minutes=POST_GRACE_MINUTES)
+        self.watching[folder_id] = deadline
+        self.schedule(deadline, self.expire, folder_id)
+
+    def expire(self, folder_id: str):
+        self.check_approvals()
+        if self.watching.pop(folder_id, None) is None:
+            return
+        print(f"Scheduler: no approval for {folder_id} by deadline, not posting.")
+        update_meta(folder_id, status="not_approved")
+        draft = load_draft(folder_id)
+        send_summary_email(False, draft["title"], draft["url"])
+
+    def publish(self, folder_id: str):
+        publish_draft(folder_id)
+
+    # ----- mail -----
+
+    def check_approvals(self):
+        if not self.watching:
+            return
+        try:
+            if self.watcher is None:
+                self.watcher = ApprovalWatcher.connect()
+            self.watcher.refresh()
+        except Exception as e:
+            print("Scheduler: IMAP error, reconnecting next round:", e)
+            self.close_mail()
+            return
+        for folder_id in [f for f in self.watching if self.watcher.is_approved(f)]:
+            del self.watching[folder_id]
+            print(f"Scheduler: {folder_id} approved, posting.")
+            try:
+                self.publish(folder_id)
+            except Exception as e:
+                print(f"Scheduler: posting {folder_id} failed:", e)
+
+    def close_mail(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+    # ----- loop -----
+
+    def recover(self) -> set:
+        """Re-arm drafts left awaiting approval by a previous process."""
+        days = set()
+        for meta_path in ARCHIVE_DIR.glob("*/meta.json"):
+            try:
+                meta = json.loads(meta_path.read_text())
+                if meta.get("status") != "awaiting_approval":
+                    continue
+                day = datetime.date.fromisoformat(meta["scheduled_for"])
+            except (OSError, ValueError, KeyError):
+                continue
+            deadline = _at_hour(day, POST_HOUR) + datetime.timedelta(minutes=POST_GRACE_MINUTES)
+            if deadline > datetime.datetime.now():
+                self.schedule(_at_hour(day, POST_HOUR), self.open_window, meta_path.parent.name, day)
+                days.add(day)
+        return days
+
+    def first_day(self, today: datetime.date, pending_days: set) -> datetime.date:
+        """Today, unless it's past its window or a previous process already handled it."""
+        deadline = _at_hour(today, POST_HOUR) + datetime.timedelta(minutes=POST_GRACE_MINUTES)
+        if today in pending_days or datetime.datetime.now() >= deadline or find_handled_draft(today):
+            return today + datetime.timedelta(days=1)
+        return today
+
+    def run(self):
+        start_preview_server()
+        get_outbox().start()  # resident sender; also drains mail left by earlier runs
+        first = self.first_day(datetime.date.today(), self.recover())
+        self.schedule(_at_hour(first, DRAFT_HOUR), self.prepare, first)
+        print("Scheduler running; first draft for", first)
+
+        while True:
+            entry = self._pop_due()
+            while entry:
+                _, _, action, args = entry
+                try:
+                    action(*args)
+                except Exception as e:
+                    print(f"Scheduler: {action.__name__}{args} failed:", e)
+                entry = self._pop_due()
+
+            self.check_approvals()
+            timeout = self._seconds_to_next()
+            if self.watching and self.watcher is not None:
+                try:
+                    self.watcher.wait(timeout)
+                except Exception as e:
+                    print("Scheduler: IMAP wait failed:", e)
+                    self.close_mail()
+            else:
+                if self.watching:
+                    # No IMAP connection right now: retry it shortly
+                    timeout = min(timeout, IMAP_POLL_SECONDS)
+                else:
+                    self.close_mail()
+                self._wake.wait(timeout)
+                self._wake.clear()
+
+# ---------- Main ----------
+
+def main():
+    now = datetime.datetime.now()
+    if now.hour < 6:
+        print("Too early (<06:00), exiting.")
+        return
+
+    mode = get_mode_for_today()
+    if mode == "none":
+        print("Sunday: skipping auto-post.")
+        return
+
+    start_preview_server()
+
+    folder_id = find_queued_draft(now.date())
+    if folder_id:
+        print("Using queued draft:", folder_id)
+        draft = load_draft(folder_id)
+        send_preview_email(folder_id, draft["title"])
+    else:
+        folder_id = now.strftime("%Y%m%d") + "-" + uuid.uuid4().hex[:6]
+        draft = generate_draft(mode, folder_id)
+    title, url = draft["title"], draft["url"]
 
     # Wait until POST_HOUR, then poll until grace end
     target = now.replace(hour=POST_HOUR, minute=0, second=0, microsecond=0)
@@ -811,14 +3304,111 @@ Requirements:
         time.sleep(max(0, sleep_secs))
 
     deadline = target + datetime.timedelta(minutes=POST_GRACE_MINUTES)
-    approved = poll_for_approval(folder_id, deadline)
+    with tracing(folder_id), span("approval"):
+        approved = poll_for_approval(folder_id, deadline)
     if not approved:
         print("No approval received by deadline, not posting.")
+        update_meta(folder_id, status="not_approved")
         send_summary_email(False, title, url)
+        print("HTTP connections:", http_client.stats())
         return
 
-    success = post_to_linkedin(title, text, img_path)
-    send_summary_email(success, title, url)
+    publish_draft(folder_id)
+    print("HTTP connections:", http_client.stats())
+
+# ---------- CLI ----------
+
+def whoami() -> list:
+    """Ask LinkedIn's userinfo endpoint who each configured token belongs to."""
+    people = []
+    for account in load_linkedin_accounts():
+        r = http_client.get("https://api.linkedin.com/v2/userinfo",
+                            headers={"Authorization": f"Bearer {account['token']}"}, timeout=15)
+        info = r.json() if r.ok else {}
+        people.append({
+            "account": account["name"],
+            "configured_urn": account["urn"],
+            "status": r.status_code,
+            "name": info.get("name"),
+            "email": info.get("email"),
+            "urn": f"urn:li:person:{info['sub']}" if info.get("sub") else None,
+        })
+    return people
+
+def cli(argv: list | None = None) -> int:
+    """
+    Entry point: `python auto_post_bot.py <command>`. Without a command
+    this is the daily run (main()). Every command imports only what it uses,
+    so cheap ones (approve-wait, post, whoami) start fast from cron/hooks.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="auto_post_bot.py", description="TecBee LinkedIn auto-poster")
+    sub = parser.add_subparsers(dest="command", metavar="command")
+    sub.add_parser("run", help="daily run: draft, preview, wait for approval, post (default)")
+    p = sub.add_parser("generate", help="build a draft in archive/ and e-mail its preview")
+    p.add_argument("--mode", help="post mode (default: today's)")
+    p.add_argument("--no-email", action="store_true", help="don't send the preview e-mail")
+    p = sub.add_parser("preview", help="serve the preview pages, or re-send a draft's preview e-mail")
+    p.add_argument("--port", type=int, default=5000)
+    p.add_argument("--send", metavar="ID", help="e-mail the preview of this draft and exit")
+    p = sub.add_parser("approve-wait", help="wait for 'APPROVE <id>' (exit 0 if approved, 1 if not)")
+    p.add_argument("id")
+    p.add_argument("--minutes", type=float, default=POST_GRACE_MINUTES, help="how long to wait")
+    p = sub.add_parser("post", help="publish an archived draft to every LinkedIn account")
+    p.add_argument("id")
+    p.add_argument("--no-summary", action="store_true", help="don't send the summary e-mail")
+    sub.add_parser("oauth", help="run the LinkedIn OAuth helper on localhost:8000")
+    sub.add_parser("whoami", help="show who the configured LinkedIn tokens belong to")
+    p = sub.add_parser("batch", help="pre-generate drafts for the coming days")
+    p.add_argument("days", type=int, nargs="?", default=BATCH_DAYS)
+    sub.add_parser("daemon", help="resident scheduler: prepare, preview and post every day")
+    p = sub.add_parser("compact", help="pack old archive folders into monthly files")
+    p.add_argument("days", type=int, nargs="?", default=ARCHIVE_PACK_AGE_DAYS)
+    sub.add_parser("reindex", help="rebuild archive/archive.db from the archive")
+    args = parser.parse_args(argv)
+    try:
+        return run_command(args)
+    finally:
+        flush_outbox()
+
+def run_command(args) -> int:
+    if args.command in (None, "run"):
+        main()
+    elif args.command == "generate":
+        mode = args.mode or get_mode_for_today()
+        if mode == "none":
+            print("Sunday: no post mode, pass --mode to generate anyway.")
+            return 1
+        folder_id = datetime.datetime.now().strftime("%Y%m%d") + "-" + uuid.uuid4().hex[:6]
+        generate_draft(mode, folder_id, send_preview=not args.no_email)
+        print(folder_id)
+    elif args.command == "preview":
+        if args.send:
+            send_preview_email(args.send, load_draft(args.send)["title"])
+        else:
+            print(f"Serving previews on http://127.0.0.1:{args.port}/preview/<id>")
+            serve_preview(args.port)
+    elif args.command == "approve-wait":
+        deadline = datetime.datetime.now() + datetime.timedelta(minutes=args.minutes)
+        return 0 if poll_for_approval(args.id, deadline) else 1
+    elif args.command == "post":
+        return 0 if publish_draft(args.id, summary=not args.no_summary) else 1
+    elif args.command == "oauth":
+        import runpy
+        runpy.run_path(str(BASE_DIR / "linkedin_oauth_helper.py"), run_name="__main__")
+    elif args.command == "whoami":
+        for person in whoami():
+            print(json.dumps(person))
+    elif args.command == "batch":
+        generate_batch(args.days)
+    elif args.command == "daemon":
+        PostScheduler().run()
+    elif args.command == "compact":
+        compact_archive(args.days)
+    elif args.command == "reindex":
+        print("Indexed", get_archive_db().rebuild(), "posts into", ARCHIVE_DB_PATH)
+    return 0
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(cli())
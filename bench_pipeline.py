@@ -0,0 +1,889 @@
+"""
+End-to-end benchmark for auto_post_bot.py against local stand-in servers.
+
+Starts stubs for Hacker News, Reddit, an RSS feed, Gemini, NVIDIA NIM, LinkedIn
+(assets / upload / ugcPosts), SMTP and IMAP on 127.0.0.1, runs a copy of the
+bot in a temporary directory (so its archive/ and cache/ start empty) with
+every upstream pointed at them, then:
+
+  - "startup": cold start of the module and of a cheap real call per CLI command
+  - "stages": calls each pipeline step on its own --runs times
+  - "main":   runs main() end to end --runs times; the preview e-mail is
+              "approved" by the IMAP stub --approve-after seconds later
+
+and writes wall-clock, per-stage percentiles, per-host HTTP numbers and
+peak memory to --out as JSON (compare two files with --compare).
+
+Latency, errors and 429s are injected per upstream, e.g.:
+
+  python bench_pipeline.py --runs 10 --latency gemini=1.5 --latency nim=3 --errors nim=0.1 --429 gemini=0.2
+
+Upstream names: hn, reddit, feed, gemini, nim, linkedin, smtp, imap.
+"""
+
+import os, re, sys, json, time, uuid, base64, random, shutil, select, argparse, platform
+import datetime, tempfile, threading, importlib.util, subprocess, socketserver, tracemalloc
+import email, email.utils
+from pathlib import Path
+from email.header import decode_header, make_header
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+import imapclient
+from PIL import Image
+from imapclient import IMAPClient
+
+try:
+    import resource  # not on Windows
+except ImportError:
+    resource = None
+
+BASE_DIR = Path(__file__).parent
+UPSTREAMS = ("hn", "reddit", "feed", "gemini", "nim", "linkedin", "smtp", "imap")
+HOSTS = {
+    "hacker-news.firebaseio.com": "hn",
+    "www.reddit.com": "reddit",
+    "feeds.example.com": "feed",
+    "generativelanguage.googleapis.com": "gemini",
+    "ai.api.nvidia.com": "nim",
+    "api.linkedin.com": "linkedin",
+}
+
+POST_TEXT = (
+    "Hey tech fam! 👋 Big news from the stub servers today.\n"
+    "- 🚀 Benchmarks run against local stand-ins\n"
+    "- 🔍 Latency, errors and 429s are injected on purpose\n"
+    "- 💡 Numbers land in a JSON file you can diff\n"
+    "#Benchmark #Python #TecBee"
+)
+
+WORDS = ("quantum rust kernel compiler browser database startup robot chip battery "
+         "satellite privacy encryption model agent cloud linux open source energy "
+         "network protocol laptop phone vision audio camera rocket gpu memory "
+         "scheduler cache editor terminal lawsuit acquisition framework").split()
+
+
+# ---------- Fault injection ----------
+
+class Faults:
+    """Per-upstream latency (seconds, +-20% jitter), error rate and 429 rate."""
+
+    def __init__(self, latency: dict, errors: dict, rate_limits: dict, seed: int):
+        self.latency = latency
+        self.errors = errors
+        self.rate_limits = rate_limits
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, name: str):
+        base = self.latency.get(name, 0.0)
+        if base > 0:
+            with self._lock:
+                jitter = self.rng.uniform(0.8, 1.2)
+            time.sleep(base * jitter)
+
+    def roll(self, name: str) -> str | None:
+        """'429', 'error' or None for one request."""
+        with self._lock:
+            x = self.rng.random()
+        if x < self.rate_limits.get(name, 0.0):
+            return "429"
+        if x < self.rate_limits.get(name, 0.0) + self.errors.get(name, 0.0):
+            return "error"
+        return None
+
+    def as_dict(self) -> dict:
+        return {"latency": self.latency, "errors": self.errors, "429": self.rate_limits}
+
+
+def parse_pairs(values: list, flag: str) -> dict:
+    out = {}
+    for v in values or []:
+        name, _, num = v.partition("=")
+        if name not in UPSTREAMS or not num:
+            raise SystemExit(f"{flag} expects NAME=NUMBER with NAME in {', '.join(UPSTREAMS)}, got {v!r}")
+        out[name] = float(num)
+    return out
+
+
+# ---------- HTTP stubs ----------
+
+def make_png(size: int = 1024) -> bytes:
+    """A noisy gradient PNG, roughly the size of a real SD3 output."""
+    rng = random.Random(0)
+    im = Image.new("RGB", (size, size))
+    px = im.load()
+    for y in range(size):
+        for x in range(size):
+            n = rng.randrange(24)
+            px[x, y] = ((x * 255 // size + n) % 256, (y * 255 // size + n) % 256, (128 + n) % 256)
+    out = tempfile.SpooledTemporaryFile()
+    im.save(out, format="PNG")
+    out.seek(0)
+    return out.read()
+
+
+class StubState:
+    def __init__(self, faults: Faults, image_b64: bytes):
+        self.faults = faults
+        self.image_b64 = image_b64
+        self.lock = threading.Lock()
+        self.topstories_calls = 0
+        self.posts = 0
+
+
+def story_title(id_: int) -> str:
+    rng = random.Random(id_)
+    return f"{rng.choice(WORDS).title()} " + " ".join(rng.sample(WORDS, 6)) + f" ({id_})"
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """One handler for every HTTP upstream; the original host comes in X-Upstream-Host."""
+
+    protocol_version = "HTTP/1.1"
+    state: StubState = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, data, status: int = 200, headers=None):
+        self._send(status, json.dumps(data).encode("utf-8"), headers=headers)
+
+    def _dispatch(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        host = self.headers.get("X-Upstream-Host", "")
+        upstream = HOSTS.get(host)
+        if upstream is None:
+            return self._send(404, b"unknown upstream")
+
+        faults = self.state.faults
+        faults.delay(upstream)
+        fault = faults.roll(upstream)
+        if fault == "429":
+            return self._json({"error": "rate limited"}, 429, {"Retry-After": "1"})
+        if fault == "error":
+            return self._json({"error": "injected failure"}, 500)
+
+        path = urlsplit(self.path).path
+        getattr(self, "_" + upstream)(path, body)
+
+    do_GET = do_POST = do_PUT = _dispatch
+
+    def _hn(self, path, body):
+        if path == "/v0/topstories.json":
+            # A fresh page of stories per call, so repeated runs aren't all duplicates
+            with self.state.lock:
+                self.state.topstories_calls += 1
+                base = self.state.topstories_calls * 1000
+            return self._json(list(range(base, base + 60)))
+        m = re.match(r"/v0/item/(\d+)\.json$", path)
+        if not m:
+            return self._send(404)
+        id_ = int(m.group(1))
+        self._json({
+            "id": id_, "type": "story", "by": "stub",
+            "title": story_title(id_),
+            "url": f"https://example.com/story/{id_}",
+            "score": 50 + id_ % 500,
+            "descendants": id_ % 200,
+            "time": int(time.time()) - (id_ % 36000),
+        })
+
+    def _reddit(self, path, body):
+        children = [{"data": {
+            "title": story_title(900000 + i),
+            "url": f"https://example.com/reddit/{i}",
+            "permalink": f"/r/technology/comments/{i}/",
+            "score": 1000 - i,
+            "num_comments": i * 3,
+            "created_utc": time.time() - i * 600,
+        }} for i in range(20)]
+        self._json({"data": {"children": children}})
+
+    def _feed(self, path, body):
+        items = "".join(
+            f"<item><title>{story_title(800000 + i)}</title>"
+            f"<link>https://example.com/feed/{i}</link>"
+            f"<pubDate>{email.utils.formatdate(time.time() - i * 900)}</pubDate></item>"
+            for i in range(15))
+        rss = f'<?xml version="1.0"?><rss version="2.0"><channel><title>Stub</title>{items}</channel></rss>'
+        self._send(200, rss.encode("utf-8"), "application/rss+xml")
+
+    def _gemini(self, path, body):
+        def chunk(text):
+            return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+        if ":streamGenerateContent" not in path:
+            return self._json(chunk(POST_TEXT))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        lines = POST_TEXT.splitlines(keepends=True)
+        for line in lines:
+            self.wfile.write(b"data: " + json.dumps(chunk(line)).encode("utf-8") + b"\r\n\r\n")
+            self.wfile.flush()
+            time.sleep(0.01)
+        self.close_connection = True
+
+    def _nim(self, path, body):
+        payload = self.state.image_b64
+        head = b'{"artifacts":[],"image":"'
+        tail = b'","finish_reason":"SUCCESS","seed":0}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(head) + len(payload) + len(tail)))
+        self.end_headers()
+        self.wfile.write(head)
+        for i in range(0, len(payload), 256 * 1024):
+            self.wfile.write(payload[i:i + 256 * 1024])
+        self.wfile.write(tail)
+
+    def _linkedin(self, path, body):
+        if path == "/v2/assets":
+            n = uuid.uuid4().hex[:12]
+            return self._json({"value": {
+                "asset": f"urn:li:digitalmediaAsset:{n}",
+                "uploadMechanism": {"com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest": {
+                    "uploadUrl": f"https://api.linkedin.com/mediaUpload/{n}",
+                }},
+            }})
+        if path.startswith("/mediaUpload/"):
+            return self._send(201)
+        if path == "/v2/userinfo":
+            return self._json({"sub": "bench0", "name": "Bench User", "email": "bench@example.com"})
+        if path == "/v2/ugcPosts":
+            with self.state.lock:
+                self.state.posts += 1
+                n = self.state.posts
+            return self._json({"id": f"urn:li:share:{n}"}, 201, {"X-RestLi-Id": f"urn:li:share:{n}"})
+        self._send(404)
+
+
+def redirect_to_stub(bot, port: int):
+    """Send the bot's HttpClient traffic for known upstreams to the local stub."""
+    base = type(bot.http_client.session.get_adapter("https://example.com"))
+
+    class StubAdapter(base):
+        def send(self, request, **kwargs):
+            parts = urlsplit(request.url)
+            if parts.hostname in HOSTS:
+                request.headers["X-Upstream-Host"] = parts.hostname
+                request.url = f"http://127.0.0.1:{port}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+            return super().send(request, **kwargs)
+
+    adapter = StubAdapter(pool_connections=bot.HTTP_POOL_HOSTS, pool_maxsize=bot.HTTP_POOL_PER_HOST)
+    bot.http_client.session.mount("http://", adapter)
+    bot.http_client.session.mount("https://", adapter)
+
+
+# ---------- Mail stubs ----------
+
+class Mailbox:
+    """Shared INBOX for the IMAP stub; the SMTP stub drops approvals into it."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.messages = []  # (uid, subject)
+        self.sent = 0
+
+    def add(self, subject: str):
+        with self.cond:
+            self.messages.append((len(self.messages) + 1, subject))
+            self.cond.notify_all()
+
+    def approve(self, preview_id: str, after: float = 0.0):
+        if after > 0:
+            threading.Timer(after, self.add, [f"Re: APPROVE {preview_id}"]).start()
+        else:
+            self.add(f"Re: APPROVE {preview_id}")
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough ESMTP for smtplib: EHLO, AUTH, MAIL, RCPT, DATA, QUIT."""
+
+    mailbox: Mailbox = None
+    faults: Faults = None
+    approve_after = 0.2
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.reply("220 stub ESMTP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode("utf-8", "replace").strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250-stub")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == "AUTH":
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                self.faults.delay("smtp")
+                fault = self.faults.roll("smtp")
+                if fault:
+                    self.reply("451 4.3.0 Injected failure" if fault == "error" else "421 4.7.0 Try again later")
+                    continue
+                self.accepted(b"".join(data))
+                self.reply("250 OK queued")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def accepted(self, raw: bytes):
+        msg = email.message_from_bytes(raw)
+        subject = str(make_header(decode_header(msg.get("Subject") or "")))
+        with self.mailbox.cond:
+            self.mailbox.sent += 1
+        # Play the reviewer: approve every preview shortly after it arrives
+        m = re.match(r"\[Preview\] LinkedIn (\S+)", subject)
+        if m and self.approve_after >= 0:
+            self.mailbox.approve(m.group(1), self.approve_after)
+
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+    """Read-only IMAP4rev1 with IDLE, covering what ApprovalWatcher sends."""
+
+    mailbox: Mailbox = None
+    faults: Faults = None
+
+    def reply(self, line):
+        self.wfile.write((line if isinstance(line, bytes) else line.encode("utf-8")) + b"\r\n")
+
+    def handle(self):
+        self.reply("* OK [CAPABILITY IMAP4rev1 IDLE] stub ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.decode("utf-8", "replace").strip().split(" ", 2)
+            if len(parts) < 2:
+                continue
+            tag, verb, rest = parts[0], parts[1].upper(), parts[2] if len(parts) > 2 else ""
+            if verb == "UID":
+                sub, _, rest = rest.partition(" ")
+                verb = "UID " + sub.upper()
+            self.faults.delay("imap")
+            if verb == "CAPABILITY":
+                self.reply("* CAPABILITY IMAP4rev1 IDLE")
+            elif verb in ("SELECT", "EXAMINE"):
+                with self.mailbox.cond:
+                    n = len(self.mailbox.messages)
+                self.reply(f"* {n} EXISTS")
+                self.reply("* 0 RECENT")
+                self.reply("* OK [UIDVALIDITY 1] UIDs valid")
+                self.reply(f"* OK [UIDNEXT {n + 1}] Predicted next UID")
+                self.reply("* FLAGS (\\Seen)")
+            elif verb == "UID SEARCH":
+                self.reply("* SEARCH " + " ".join(str(u) for u in self.search(rest)))
+            elif verb == "UID FETCH":
+                self.fetch(rest.split(" ", 1)[0])
+            elif verb == "IDLE":
+                self.idle()
+            elif verb == "LOGOUT":
+                self.reply("* BYE stub logging out")
+                self.reply(f"{tag} OK LOGOUT completed")
+                return
+            elif verb not in ("LOGIN", "NOOP", "CHECK", "CLOSE"):
+                self.reply(f"{tag} BAD unsupported")
+                continue
+            self.reply(f"{tag} OK {verb} completed")
+
+    def search(self, criteria: str) -> list:
+        with self.mailbox.cond:
+            messages = list(self.mailbox.messages)
+        m = re.search(r"UID (\d+):\*", criteria)
+        low = int(m.group(1)) if m else 1
+        s = re.search(r'SUBJECT "?([^"\s]+)"?', criteria)
+        word = s.group(1).upper() if s else ""
+        uids = [u for u, subj in messages if u >= low and word in subj.upper()]
+        if m and not uids and messages:
+            uids = [messages[-1][0]] if word in messages[-1][1].upper() else []
+        return uids
+
+    def fetch(self, uid_set: str):
+        ranges = []
+        for piece in uid_set.split(","):
+            lo, _, hi = piece.partition(":")
+            ranges.append((int(lo), float("inf") if hi == "*" else int(hi or lo)))
+        with self.mailbox.cond:
+            messages = [(u, s) for u, s in self.mailbox.messages if any(lo <= u <= hi for lo, hi in ranges)]
+        for uid, subject in messages:
+            literal = f"Subject: {subject}\r\n\r\n".encode("utf-8")
+            self.wfile.write(f"* {uid} FETCH (UID {uid} BODY[HEADER.FIELDS (SUBJECT)] {{{len(literal)}}}\r\n".encode()
+                             + literal + b")\r\n")
+
+    def idle(self):
+        self.reply("+ idling")
+        with self.mailbox.cond:
+            seen = len(self.mailbox.messages)
+        while True:
+            with self.mailbox.cond:
+                self.mailbox.cond.wait_for(lambda: len(self.mailbox.messages) != seen, timeout=0.05)
+                count = len(self.mailbox.messages)
+            if count != seen:
+                seen = count
+                self.reply(f"* {count} EXISTS")
+            if select.select([self.connection], [], [], 0)[0]:
+                line = self.rfile.readline()
+                if not line or line.strip().upper() == b"DONE":
+                    return
+
+
+def serve(server_cls, handler, **attrs) -> socketserver.BaseServer:
+    handler = type(handler.__name__, (handler,), attrs)
+    server = server_cls(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class MailServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+# ---------- Bot under test ----------
+
+def load_bot(workdir: Path, env: dict):
+    """Import a copy of auto_post_bot.py living in `workdir` (fresh archive/ + cache/)."""
+    shutil.copy(BASE_DIR / "auto_post_bot.py", workdir / "auto_post_bot.py")
+    os.environ.update(env)
+    spec = importlib.util.spec_from_file_location("auto_post_bot", workdir / "auto_post_bot.py")
+    bot = importlib.util.module_from_spec(spec)
+    sys.modules["auto_post_bot"] = bot
+    spec.loader.exec_module(bot)
+    return bot
+
+
+def shift_clock(bot, hours: int):
+    """Make the bot's datetime.now() run `hours` ahead (main() refuses to run before 06:00)."""
+    import types
+    real = datetime.datetime
+    offset = datetime.timedelta(hours=hours)
+
+    class ShiftedDatetime(real):
+        @classmethod
+        def now(cls, tz=None):
+            return real.now(tz) + offset
+
+    clock = types.ModuleType("datetime")
+    clock.__dict__.update(datetime.__dict__)
+    clock.datetime = ShiftedDatetime
+    bot.datetime = clock
+
+
+# ---------- Measurement ----------
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered) + 0.5)) - 1))]
+
+def summarize(samples: list, errors: int = 0) -> dict:
+    return {
+        "n": len(samples),
+        "errors": errors,
+        "mean": round(sum(samples) / len(samples), 4) if samples else 0.0,
+        "p50": round(percentile(samples, 0.50), 4),
+        "p90": round(percentile(samples, 0.90), 4),
+        "p99": round(percentile(samples, 0.99), 4),
+        "max": round(max(samples), 4) if samples else 0.0,
+    }
+
+def max_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+def git_version() -> str | None:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def read_trace(folder: Path) -> list:
+    try:
+        return [json.loads(l) for l in (folder / "trace.jsonl").read_text(encoding="utf-8").splitlines() if l]
+    except (OSError, ValueError):
+        return []
+
+def http_summary(events: list) -> dict:
+    hosts = {}
+    for e in events:
+        h = hosts.setdefault(e["host"], {"samples": [], "errors": 0, "429": 0, "bytes": 0})
+        h["samples"].append(e["seconds"])
+        h["bytes"] += e.get("bytes", 0)
+        if e["status"] == "429":
+            h["429"] += 1
+        elif e["status"] == "error" or e["status"].startswith("5"):
+            h["errors"] += 1
+    return {host: {**summarize(h["samples"], h["errors"]), "429": h["429"], "bytes": h["bytes"]}
+            for host, h in sorted(hosts.items())}
+
+
+class Scenario:
+    """Collects per-stage samples plus wall-clock and peak traced memory."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.samples = {}
+        self.errors = {}
+        self.started = None
+
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.started
+        self.peak_mb = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+
+    def time(self, stage: str, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+            print(f"[bench] {stage} failed:", e)
+        finally:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - started)
+
+    def add(self, stage: str, seconds: float, ok: bool = True):
+        self.samples.setdefault(stage, []).append(seconds)
+        if not ok:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def result(self, **extra) -> dict:
+        return {
+            "wall_seconds": round(self.wall, 3),
+            "peak_traced_mb": self.peak_mb,
+            "stages": {s: summarize(v, self.errors.get(s, 0)) for s, v in sorted(self.samples.items())},
+            **extra,
+        }
+
+
+def bench_stages(bot, mailbox: Mailbox, runs: int, mode: str) -> dict:
+    work = bot.ARCHIVE_DIR / "_bench_stages"
+    work.mkdir(parents=True, exist_ok=True)
+    title = story_title(42)
+    with Scenario("stages") as sc:
+        for i in range(runs):
+            sc.time("topics", bot.fetch_topic_candidates)
+            sc.time("text", bot.generate_text_with_gemini, title, mode, use_cache=False)
+            image = work / f"image{i}.png"
+            sc.time("image", bot.generate_image_with_nvidia, f"benchmark image {i}", image, use_cache=False)
+            if not image.exists():
+                bot.fallback_image(title, image)
+            upload = sc.time("optimize", bot.optimize_image, image)
+            upload_path = work / upload["file"] if upload else image
+            sc.time("preview_email", bot.send_preview_email, f"BENCH-{i}", title)  # enqueue only
+            sc.time("mail_delivery", bot.get_outbox().flush, 30)
+            mailbox.approve(f"BENCH-{i}")
+            deadline = datetime.datetime.now() + datetime.timedelta(seconds=30)
+            sc.time("approval", bot.poll_for_approval, f"BENCH-{i}", deadline)
+            report = sc.time("publish", bot.publish_to_accounts, title, POST_TEXT, upload_path)
+            if report and report["failed"]:
+                sc.errors["publish"] = sc.errors.get("publish", 0) + 1
+    return sc.result()
+
+
+def bench_main(bot, runs: int) -> dict:
+    events = []
+    outcomes = []
+    with Scenario("main") as sc:
+        for i in range(runs):
+            before = {p.name for p in bot.ARCHIVE_DIR.glob("*")}
+            started = time.perf_counter()
+            error = None
+            try:
+                bot.main()
+            except Exception as e:
+                error = str(e)
+                print("[bench] main() failed:", e)
+            seconds = time.perf_counter() - started
+            sc.add("main", seconds, error is None)
+            new = [bot.ARCHIVE_DIR / n for n in {p.name for p in bot.ARCHIVE_DIR.glob("*")} - before]
+            status = None
+            for folder in new:
+                for e in read_trace(folder):
+                    if e.get("type") == "span":
+                        sc.add(e["name"], e["seconds"], e.get("ok", True))
+                    elif e.get("type") == "http":
+                        events.append(e)
+                try:
+                    status = json.loads((folder / "meta.json").read_text(encoding="utf-8")).get("status")
+                except (OSError, ValueError):
+                    pass
+            outcomes.append({"run": i, "seconds": round(seconds, 3), "status": status, "error": error})
+    return sc.result(runs=outcomes, http=http_summary(events))
+
+
+# Runs `auto_post_bot <command>` in a child process with its upstreams pointed
+# at the stubs. The patches only wrap the places where the bot itself lazily
+# imports requests / imapclient, so each command still pays its own imports.
+STUB_CLI = """
+import os, sys, json
+from urllib.parse import urlsplit
+import auto_post_bot as bot
+
+PORT, IMAP_PORT = int(os.environ["BENCH_HTTP_PORT"]), int(os.environ["BENCH_IMAP_PORT"])
+HOSTS = json.loads(os.environ["BENCH_HOSTS"])
+make_session = bot.HttpClient._make_session
+
+def stubbed_session(self):
+    session = make_session(self)
+    base = type(session.get_adapter("https://example.com"))
+
+    class StubAdapter(base):
+        def send(self, request, **kwargs):
+            parts = urlsplit(request.url)
+            if parts.hostname in HOSTS:
+                request.headers["X-Upstream-Host"] = parts.hostname
+                request.url = f"http://127.0.0.1:{PORT}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+            return super().send(request, **kwargs)
+
+    adapter = StubAdapter(pool_connections=self.pool_hosts, pool_maxsize=self.pool_per_host)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+connect = bot.ApprovalWatcher.connect.__func__
+
+def stubbed_connect(cls):
+    import imapclient
+    real = imapclient.IMAPClient
+    imapclient.IMAPClient = lambda host, ssl=True, **kw: real("127.0.0.1", port=IMAP_PORT, ssl=False)
+    return connect(cls)
+
+bot.HttpClient._make_session = stubbed_session
+bot.ApprovalWatcher.connect = classmethod(stubbed_connect)
+raise SystemExit(bot.cli(sys.argv[1:]))
+"""
+
+def bench_startup(bot, mailbox: Mailbox, runs: int, mode: str, http_port: int, imap_port: int) -> dict:
+    """
+    Cold start of a fresh interpreter: `import auto_post_bot`, and a real,
+    cheap call of each CLI command against the stubs, so a heavy import
+    added to one command's path shows up in its row. run, batch, daemon and
+    oauth are long-running or interactive and are left out; "--help" is
+    the argument parser alone.
+    """
+    workdir = Path(bot.__file__).parent
+    (workdir / "stub_cli.py").write_text(STUB_CLI, encoding="utf-8")
+    env = {**os.environ, "BENCH_HTTP_PORT": str(http_port), "BENCH_IMAP_PORT": str(imap_port),
+           "BENCH_HOSTS": json.dumps(list(HOSTS))}
+
+    draft_id = datetime.date.today().strftime("%Y%m%d") + "-bench0"
+    folder = bot.ARCHIVE_DIR / draft_id
+    folder.mkdir(parents=True, exist_ok=True)
+    title = story_title(7)
+    (folder / "text.txt").write_text(POST_TEXT, encoding="utf-8")
+    bot.fallback_image(title, folder / "image.png")
+    mailbox.approve(draft_id)
+
+    def reset_draft():
+        # `post` skips accounts it already posted to; start every run fresh
+        (folder / "meta.json").write_text(json.dumps({"title": title, "url": "https://example.com/7"}))
+
+    def run(*argv, cli=False):
+        if cli:
+            argv = ("stub_cli.py", *argv)
+        subprocess.run([sys.executable, *argv], cwd=workdir, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    commands = {
+        "--help": ["--help"],
+        "approve-wait": ["approve-wait", draft_id, "--minutes", "1"],
+        "post": ["post", draft_id, "--no-summary"],
+        "preview --send": ["preview", "--send", draft_id],
+        "whoami": ["whoami"],
+        "reindex": ["reindex"],
+        "compact": ["compact", "36500"],
+        "generate": ["generate", "--mode", mode, "--no-email"],
+    }
+    reset_draft()
+    run("-c", "import auto_post_bot")  # write the .pyc outside the timings
+    with Scenario("startup") as sc:
+        for _ in range(runs):
+            sc.time("python", run, "-c", "pass")
+            sc.time("import", run, "-c", "import auto_post_bot")
+            for name, argv in commands.items():
+                reset_draft()
+                sc.time(name, run, *argv, cli=True)
+    return sc.result()
+
+
+def compare(current: dict, baseline_path: Path):
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    print(f"\nvs {baseline_path} ({baseline.get('version') or 'unknown version'}):")
+    for name, scenario in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        for stage, s in scenario["stages"].items():
+            o = old["stages"].get(stage)
+            if not o or not o["p50"]:
+                continue
+            print(f"  {name}/{stage:<14} p50 {o['p50']:.3f}s -> {s['p50']:.3f}s ({s['p50'] / o['p50'] - 1:+.0%})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the posting pipeline against local stubs.")
+    ap.add_argument("--runs", type=int, default=5, help="iterations per scenario")
+    ap.add_argument("--scenario", choices=["all", "startup", "stages", "main"], default="all")
+    ap.add_argument("--mode", default="article", help="post mode used for every run")
+    ap.add_argument("--accounts", type=int, default=1, help="LinkedIn accounts to publish to")
+    ap.add_argument("--latency", action="append", metavar="NAME=SECONDS")
+    ap.add_argument("--errors", action="append", metavar="NAME=RATE", help="share of requests answered with 5xx")
+    ap.add_argument("--429", dest="rate_limits", action="append", metavar="NAME=RATE",
+                    help="share of requests answered with 429")
+    ap.add_argument("--approve-after", type=float, default=0.2,
+                    help="seconds until the IMAP stub approves a preview (-1: never)")
+    ap.add_argument("--stream", action="store_true", help="use streaming Gemini generation")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", metavar="BASELINE.json", help="print p50 changes against an earlier run")
+    ap.add_argument("--keep", action="store_true", help="keep the temporary bot directory")
+    args = ap.parse_args()
+
+    faults = Faults(parse_pairs(args.latency, "--latency"), parse_pairs(args.errors, "--errors"),
+                    parse_pairs(args.rate_limits, "--429"), args.seed)
+    random.seed(args.seed)
+
+    print("[bench] Rendering stub image...")
+    state = StubState(faults, base64.b64encode(make_png()))
+    UpstreamHandler.state = state
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    http_server.daemon_threads = True
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    mailbox = Mailbox()
+    smtp_server = serve(MailServer, SMTPHandler, mailbox=mailbox, faults=faults, approve_after=args.approve_after)
+    imap_server = serve(MailServer, IMAPHandler, mailbox=mailbox, faults=faults)
+    smtp_port, imap_port = smtp_server.server_address[1], imap_server.server_address[1]
+
+    workdir = Path(tempfile.mkdtemp(prefix="tecbee-bench-"))
+    accounts = [{"name": f"bench{i}", "urn": f"urn:li:person:bench{i}", "token": f"token{i}"}
+                for i in range(args.accounts)]
+    (workdir / "linkedin_accounts.json").write_text(json.dumps(accounts), encoding="utf-8")
+    now = datetime.datetime.now()
+    shift = 6 - now.hour if now.hour < 6 else 0
+    env = {
+        "GEMINI_KEYS": "bench-key-1,bench-key-2",
+        "GEMINI_STREAM": "1" if args.stream else "0",
+        "GEMINI_CACHE_BYPASS": "1",
+        "NIM_CACHE_BYPASS": "1",
+        "NVIDIA_API_KEY": "bench",
+        "HN_ITEM_TTL_SECONDS": "0",
+        "TOPIC_SOURCES": "hn reddit:technology feed:https://feeds.example.com/rss",
+        "LINKEDIN_ACCOUNTS_FILE": str(workdir / "linkedin_accounts.json"),
+        "LINKEDIN_MIN_INTERVAL": "0",
+        "EMAIL_USER": "bench@example.com",
+        "EMAIL_TO": "bench@example.com",
+        "EMAIL_PASS": "bench",
+        "EMAIL_SMTP": "127.0.0.1",
+        "EMAIL_SMTP_PORT": str(smtp_port),
+        "EMAIL_SMTP_STARTTLS": "0",  # the stub speaks plain SMTP
+        "EMAIL_RETRY_BASE_SECONDS": "0.2",
+        "EMAIL_IMAP": "127.0.0.1",
+        "IMAP_POLL_SECONDS": "1",
+        "POST_HOUR": str((now.hour + shift) % 24),
+        # main() waits from POST_HOUR:00 until the grace period ends
+        "POST_GRACE_MINUTES": str(now.minute + 3),
+    }
+    tracemalloc.start()
+    bot = load_bot(workdir, env)
+    redirect_to_stub(bot, http_server.server_address[1])
+    # The bot imports these lazily, so patch the modules rather than the bot
+    imapclient.IMAPClient = lambda host, ssl=True, **kw: IMAPClient("127.0.0.1", port=imap_port, ssl=False)
+    bot.start_preview_server = lambda: None
+    bot.get_mode_for_today = lambda: args.mode
+    if shift:
+        shift_clock(bot, shift)
+
+    results = {
+        "version": git_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {"runs": args.runs, "mode": args.mode, "accounts": args.accounts,
+                   "stream": args.stream, "approve_after": args.approve_after,
+                   "seed": args.seed, "faults": faults.as_dict()},
+        "scenarios": {},
+    }
+    try:
+        if args.scenario in ("all", "startup"):
+            print(f"[bench] CLI startup x{args.runs}...")
+            results["scenarios"]["startup"] = bench_startup(bot, mailbox, args.runs, args.mode,
+                                                            http_server.server_address[1], imap_port)
+        if args.scenario in ("all", "stages"):
+            print(f"[bench] Stages x{args.runs}...")
+            results["scenarios"]["stages"] = bench_stages(bot, mailbox, args.runs, args.mode)
+        if args.scenario in ("all", "main"):
+            print(f"[bench] main() x{args.runs}...")
+            results["scenarios"]["main"] = bench_main(bot, args.runs)
+    finally:
+        bot.get_outbox().flush(30)  # summaries still queued when main() returned
+        results["max_rss_mb"] = max_rss_mb()
+        # Every stubbed upstream shares the one 127.0.0.1 pool, so opens are
+        # only meaningful in total; drop the per-host split
+        stats = bot.http_client.stats()
+        results["http_connections"] = {k: stats[k] for k in ("requests", "opened", "reused")}
+        for server in (http_server, smtp_server, imap_server):
+            server.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print("[bench] Bot directory kept at", workdir)
+
+    out = Path(args.out)
+    out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    print()
+    for name, scenario in results["scenarios"].items():
+        print(f"{name}: {scenario['wall_seconds']}s wall, peak {scenario['peak_traced_mb']} MB traced")
+        for stage, s in scenario["stages"].items():
+            print(f"  {stage:<14} n={s['n']:<3} p50={s['p50']:.3f}s p90={s['p90']:.3f}s "
+                  f"p99={s['p99']:.3f}s max={s['max']:.3f}s errors={s['errors']}")
+    print("max RSS:", results["max_rss_mb"], "MB")
+    print("HTTP connections:", results["http_connections"])
+    print("Results written to", out)
+    if args.compare:
+        compare(results, Path(args.compare))
+    conns = results["http_connections"]
+    if conns["requests"] and conns["opened"] < 1:
+        raise SystemExit("HTTP connection counting is broken: requests made but no connection opened")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import time
+
+import auto_post_bot as bot
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+def test_cached_items_older_than_ttl_get_fresh_scores(tmp_path, monkeypatch):
+    cache = bot.ResponseCache(bot.DiskCache(tmp_path, 1024 * 1024))
+    url = "https://hacker-news.firebaseio.com/v0/item/1.json"
+    cache.store.write_json(url, {"url": url, "stored_at": time.time() - bot.HN_ITEM_TTL_SECONDS - 60,
+                                 "body": {"id": 1, "title": "Story", "score": 10, "descendants": 1}})
+    monkeypatch.setattr(bot, "response_cache", cache)
+    monkeypatch.setattr(bot.http_client, "get", lambda url, **kw: FakeResponse(
+        {"id": 1, "title": "Story", "score": 250, "descendants": 80}))
+
+    [item] = bot.fetch_hn_items([1], time.monotonic() + 5)
+    assert (item["score"], item["descendants"]) == (250, 80)
@@ -0,0 +1,22 @@
+import auto_post_bot as bot
+
+
+def make_image(path):
+    from PIL import Image
+    Image.new("RGB", (64, 48), (200, 30, 30)).save(path)
+    return path
+
+
+def test_unreachable_psnr_floor_keeps_the_original(tmp_path):
+    src = make_image(tmp_path / "image.png")
+    result = bot.optimize_image(src, min_psnr=100.0)
+    assert result["format"] == "original"
+    assert result["file"] == "image.png"
+
+
+def test_stale_uploads_are_removed(tmp_path):
+    src = make_image(tmp_path / "image.png")
+    (tmp_path / "upload.jpg").write_bytes(b"old run")
+    result = bot.optimize_image(src, min_psnr=100.0)
+    assert not (tmp_path / "upload.jpg").exists()
+    assert (tmp_path / result["file"]).exists()
@@ -0,0 +1,23 @@
+import time
+
+import auto_post_bot as bot
+
+
+def test_flush_skips_mail_backing_off_past_the_deadline(tmp_path, monkeypatch):
+    # Nothing listens on port 1: every attempt fails and the retry is pushed out
+    monkeypatch.setattr(bot, "EMAIL_SMTP", "127.0.0.1")
+    monkeypatch.setattr(bot, "EMAIL_SMTP_PORT", 1)
+    monkeypatch.setattr(bot, "EMAIL_RETRY_BASE_SECONDS", 300)
+    outbox = bot.MailOutbox(tmp_path)
+    outbox.enqueue("to@example.com", "hello", "body")
+
+    started = time.monotonic()
+    assert outbox.flush(30) is False
+    assert time.monotonic() - started < 5
+    assert len(outbox.unsent()) == 1
+
+
+def test_flush_ignores_mail_queued_by_other_runs(tmp_path):
+    other = bot.MailOutbox(tmp_path)
+    other._write(tmp_path / "1-abc.json", {"id": "1-abc", "next_try": 0})
+    assert bot.MailOutbox(tmp_path).flush(30) is True
@@ -0,0 +1,39 @@
+import json
+
+import auto_post_bot as bot
+
+
+def test_retry_only_posts_to_accounts_that_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "ARCHIVE_DIR", tmp_path)
+    monkeypatch.setattr(bot, "index_post", lambda folder_id: None)
+    monkeypatch.setattr(bot, "send_summary_email", lambda *a: None)
+    folder = tmp_path / "20240101-abc123"
+    folder.mkdir()
+    (folder / "text.txt").write_text("Hey tech fam", encoding="utf-8")
+    (folder / "image.png").write_bytes(b"png")
+    (folder / "meta.json").write_text(json.dumps({
+        "title": "A story", "url": "https://example.com/a", "status": "post_failed",
+        "publish": {"ok": 1, "failed": 1, "seconds": 1.0, "accounts": [
+            {"name": "alice", "urn": "urn:li:person:a", "ok": True, "post_id": "urn:li:share:1"},
+            {"name": "bob", "urn": "urn:li:person:b", "ok": False, "error": "500"},
+        ]},
+    }))
+    monkeypatch.setattr(bot, "load_linkedin_accounts", lambda: [
+        {"name": "alice", "urn": "urn:li:person:a", "token": "t1"},
+        {"name": "bob", "urn": "urn:li:person:b", "token": "t2"},
+    ])
+    posted_to = []
+
+    def publish_to_accounts(title, text, image, accounts=None):
+        posted_to.extend(a["name"] for a in accounts)
+        return {"ok": len(accounts), "failed": 0, "seconds": 0.1,
+                "accounts": [{"name": a["name"], "urn": a["urn"], "ok": True} for a in accounts]}
+
+    monkeypatch.setattr(bot, "publish_to_accounts", publish_to_accounts)
+
+    assert bot.publish_draft(folder.name) is True
+    assert posted_to == ["bob"]
+    meta = json.loads((folder / "meta.json").read_text())
+    assert meta["status"] == "posted"
+    assert meta["publish"]["ok"] == 2 and meta["publish"]["failed"] == 0
+    assert {a["name"] for a in meta["publish"]["accounts"]} == {"alice", "bob"}
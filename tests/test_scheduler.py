@@ -0,0 +1,45 @@
+import datetime
+import json
+
+import pytest
+
+import auto_post_bot as bot
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "ARCHIVE_DIR", tmp_path)
+    # Keep today's posting window open whatever time the test runs
+    monkeypatch.setattr(bot, "POST_HOUR", 0)
+    monkeypatch.setattr(bot, "POST_GRACE_MINUTES", 24 * 60)
+    return tmp_path
+
+
+def write_draft(archive, day, status):
+    folder = archive / f"{day:%Y%m%d}-abc123"
+    folder.mkdir()
+    (folder / "meta.json").write_text(json.dumps({
+        "title": "Already posted", "url": "https://example.com/a",
+        "status": status, "scheduled_for": day.isoformat(),
+    }))
+    return folder.name
+
+
+def test_restart_after_todays_post_starts_tomorrow(archive, monkeypatch):
+    today = datetime.date.today()
+    write_draft(archive, today, "posted")
+    scheduler = bot.PostScheduler()
+
+    assert scheduler.first_day(today, scheduler.recover()) == today + datetime.timedelta(days=1)
+
+    monkeypatch.setattr(bot, "get_mode_for_date", lambda day: "article")
+    monkeypatch.setattr(bot, "generate_draft", lambda *a, **kw: pytest.fail("today was drafted again"))
+    monkeypatch.setattr(bot, "send_preview_email", lambda *a: pytest.fail("second preview e-mail"))
+    scheduler.prepare(today)
+    assert [args for _, _, action, args in scheduler._heap if action == scheduler.open_window] == []
+
+
+def test_fresh_start_prepares_today(archive):
+    today = datetime.date.today()
+    scheduler = bot.PostScheduler()
+    assert scheduler.first_day(today, scheduler.recover()) == today
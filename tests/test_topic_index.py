@@ -0,0 +1,29 @@
+import threading
+
+import auto_post_bot as bot
+
+
+def test_concurrent_add_keeps_every_entry(tmp_path):
+    index = bot.TopicIndex(tmp_path)
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(200):
+                index.add(f"2024010{n}-{i:04d}", f"Story {n} number {i} about compilers",
+                          f"https://example.com/{n}/{i}")
+        except Exception as e:  # surfaced below; a thread can't fail the test itself
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in (1, 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(index.entries) == 400
+    assert list(tmp_path.glob("*.tmp")) == []
+    reloaded = bot.TopicIndex(tmp_path).load()
+    assert len(reloaded.entries) == 400
+    assert reloaded.find_duplicate("anything", "https://example.com/2/199") == "20240102-0199"
@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+import auto_post_bot as bot
+
+
+class StubSource(bot.TopicSource):
+    def __init__(self, name, titles, budget=1.0, until_deadline=False):
+        super().__init__(budget)
+        self.name = name
+        self.titles = titles
+        self.until_deadline = until_deadline
+
+    def fetch(self, limit, deadline):
+        if self.until_deadline:
+            # Like fetch_hn_items: give up on stragglers at the deadline and
+            # hand back what arrived, which takes a moment more
+            time.sleep(max(0.0, deadline - time.monotonic()) + 0.05)
+        return [{"title": t, "url": f"https://example.com/{i}/{t.split()[-1]}",
+                 "score": 1, "comments": 0, "time": None} for i, t in enumerate(self.titles)]
+
+
+@pytest.fixture(autouse=True)
+def empty_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "get_topic_index", lambda: bot.TopicIndex(tmp_path))
+
+
+def test_partial_results_returned_at_the_deadline_are_kept():
+    titles = [f"Partial story that arrived in time number {i}" for i in range(5)]
+    source = StubSource("Hacker News", titles, budget=0.5, until_deadline=True)
+    candidates = bot.fetch_topic_candidates(sources=[source])
+    assert [c["title"] for c in candidates] == titles
+
+
+def test_sources_sharing_a_name_are_all_merged():
+    world = StubSource("Feed news.example.com", [f"World headline worth reading alpha{i}" for i in range(3)])
+    tech = StubSource("Feed news.example.com", [f"Tech headline worth reading beta{i}" for i in range(3)])
+    candidates = bot.fetch_topic_candidates(sources=[world, tech])
+    assert len(candidates) == 6